@@ -13,31 +13,49 @@ import os
 
 # Variables et données
 import json
+import asyncio
+import functools
+import itertools
+import operator
+import hashlib
+import time
+from collections import ChainMap
 from typing import TypedDict, List, Annotated, Any, Optional
 import pandas as pd
-from io import StringIO
+import pyarrow as pa
+import numpy as np
+import orjson
 import textwrap
+import logging
+import logging.handlers
+import queue
+import atexit
 
-# Graphiques
-import plotly.express as px
-import plotly.io as pio
-import plotly.graph_objects as go
-import graphviz
+# Graphiques : plotly est importé de manière paresseuse dans les fonctions qui créent des figures,
+# pour ne pas payer son chargement au démarrage du module
 
 # Numéro de session unique
 import uuid
 
 # Import de scripts
 from src.fetch_data import APILimitError 
-from src.chart_theme import stella_theme 
+from src.chart_theme import stella_theme, plotly_layout
+from src.resolve_ticker import resolve_tickers
+from src.blob_cache import BlobCache
+from src.downsample import lttb_indices
+from src.expiring_saver import ExpiringMemorySaver
+from src.ttl_cache import TTLCache
 
 # LangGraph et LangChain
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, ToolMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, ToolMessage, SystemMessage, RemoveMessage, message_chunk_to_message
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+from langchain_core.runnables import RunnableConfig
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_core.tracers.langchain import LangChainTracer
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import AnyMessage, add_messages
-from langgraph.checkpoint.memory import MemorySaver
-from langsmith import Client
 
 # Configuration HTTP pour éviter les timeouts après inactivité
 import httpx
@@ -59,7 +77,7 @@ from tools import (
     _fetch_price_history_logic,
     _compare_fundamental_metrics_logic,
     _compare_price_histories_logic
-    # _query_research_document_logic importé de manière paresseuse dans execute_tool_node
+    # La recherche PDF est importée de manière paresseuse par get_query_research_logic
 )
 
 # Variables d'environnement et constantes
@@ -69,6 +87,9 @@ LANGSMITH_TRACING = True
 LANGSMITH_ENDPOINT = "https://api.smith.langchain.com"
 LANGSMITH_API_KEY = os.getenv("LANGSMITH_API_KEY")
 LANGSMITH_PROJECT = os.environ.get("LANGCHAIN_PROJECT", "stella")
+# Part des conversations envoyées à LangSmith. 1.0 par défaut : la visualisation des traces
+# du frontend a besoin de la trace de chaque message ; à baisser en production si besoin.
+LANGSMITH_SAMPLE_RATE = float(os.environ.get("LANGSMITH_SAMPLE_RATE", "1.0"))
 
 # Session mapping for dual session system
 # Maps message session IDs to conversation session IDs for graph visualization
@@ -76,42 +97,163 @@ MESSAGE_TO_CONVERSATION_MAPPING = {}
 # Maps message session IDs to LangGraph run IDs for specific trace retrieval
 MESSAGE_TO_RUN_MAPPING = {}
 
+logger = logging.getLogger(__name__)
+
+# Les logs de l'agent passent par une file : l'écriture (console, fichiers) est faite par un thread
+# dédié, sans bloquer la boucle asyncio pendant l'exécution des noeuds et des outils.
+_log_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.propagate = False
+
+class _RootForwardHandler(logging.Handler):
+    """Transmet les enregistrements sortis de la file aux handlers du logger racine (configurés par l'API)."""
+    def emit(self, record):
+        logging.getLogger().handle(record)
+
+@functools.lru_cache(maxsize=1)
+def start_log_listener() -> logging.handlers.QueueListener:
+    """Démarre une seule fois le thread qui vide la file de logs."""
+    listener = logging.handlers.QueueListener(_log_queue, _RootForwardHandler())
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
 if not OPENROUTER_API_KEY:
-    raise ValueError("OPENROUTER_API_KEY n'a pas été enregistrée comme variable d'environnement.")
-
-# Configurer le client httpx avec des timeouts robustes pour éviter les blocages
-# Problème résolu : après inactivité, les connexions TCP vers OpenRouter deviennent obsolètes
-httpx_client = httpx.Client(
-    timeout=httpx.Timeout(
-        connect=10.0,    # Timeout pour établir la connexion
-        read=120.0,      # Timeout pour lire la réponse (important pour les LLMs)
-        write=10.0,      # Timeout pour envoyer la requête
-        pool=5.0         # Timeout pour obtenir une connexion du pool
-    ),
-    limits=httpx.Limits(
-        max_connections=10,
-        max_keepalive_connections=5,
-        keepalive_expiry=60.0  # Expire les connexions keep-alive après 60s
-    ),
-    headers={
-        "User-Agent": "Stella-Agent/1.0",
-        "Connection": "close"  # Force la fermeture des connexions après chaque requête
-    }
-)
+    logger.warning("OPENROUTER_API_KEY n'est pas définie : l'agent échouera au premier appel au LLM.")
+
+# Le LLM et son client HTTP sont construits à la première utilisation plutôt qu'à l'import :
+# l'API peut importer ce module (health checks, traces) sans payer l'initialisation ni exiger la clé.
+@functools.lru_cache(maxsize=1)
+def get_llm() -> ChatOpenAI:
+    """Construit (une seule fois) le LLM OpenRouter et son client httpx asynchrone."""
+    if not OPENROUTER_API_KEY:
+        raise ValueError("OPENROUTER_API_KEY n'a pas été enregistrée comme variable d'environnement.")
+
+    # Configurer le client httpx avec des timeouts robustes pour éviter les blocages
+    # Problème résolu : après inactivité, les connexions TCP vers OpenRouter deviennent obsolètes.
+    # Plutôt que de fermer la connexion après chaque requête, on recycle les sockets inactives
+    # avant que le serveur ne les ferme, et on relance les connexions échouées au niveau transport.
+    httpx_async_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(
+            connect=10.0,    # Timeout pour établir la connexion
+            read=120.0,      # Timeout pour lire la réponse (important pour les LLMs)
+            write=10.0,      # Timeout pour envoyer la requête
+            pool=5.0         # Timeout pour obtenir une connexion du pool
+        ),
+        # Les limites du pool sont portées par le transport (httpx ignore `limits` quand un transport est fourni)
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,  # Relance les erreurs de connexion (socket obsolète)
+            limits=httpx.Limits(
+                max_connections=20,           # Sessions concurrentes
+                max_keepalive_connections=5,
+                keepalive_expiry=30.0  # Recycle les connexions inactives avant leur fermeture côté serveur
+            )
+        ),
+        headers={
+            "User-Agent": "Stella-Agent/1.0"
+        }
+    )
 
-# Initialiser le LLM avec OpenRouter et le client httpx configuré
-llm = ChatOpenAI(
-    model=OPENROUTER_MODEL,
-    api_key=OPENROUTER_API_KEY,
-    base_url="https://openrouter.ai/api/v1",
-    temperature=0,
-    streaming=True,  # Enable streaming
-    http_client=httpx_client,  # Utilise notre client configuré
-    request_timeout=120,        # Timeout global de 2 minutes
-    max_retries=2,              # Retry en cas de timeout
-)
-print(f"✅ ChatOpenAI initialized with OpenRouter using model: {OPENROUTER_MODEL}")
-print(f"🔧 HTTP client configured with robust timeouts to prevent post-inactivity hangs")
+    # Initialiser le LLM avec OpenRouter et le client httpx asynchrone configuré
+    llm = ChatOpenAI(
+        model=OPENROUTER_MODEL,
+        api_key=OPENROUTER_API_KEY,
+        base_url="https://openrouter.ai/api/v1",
+        temperature=0,
+        streaming=True,  # Enable streaming
+        http_async_client=httpx_async_client,  # Utilise notre client asynchrone configuré
+        request_timeout=120,        # Timeout global de 2 minutes
+        max_retries=2,              # Retry en cas de timeout
+    )
+    logger.info("ChatOpenAI initialisé via OpenRouter avec le modèle %s", OPENROUTER_MODEL)
+    return llm
+
+# La liste des outils est statique : leur spécification OpenAI (schémas JSON) est calculée une
+# seule fois au chargement, puis liée telle quelle au LLM sans repasser par le convertisseur
+OPENAI_TOOL_SPECS = [convert_to_openai_tool(tool) for tool in available_tools]
+
+@functools.lru_cache(maxsize=1)
+def get_llm_with_tools():
+    """Retourne le LLM lié aux outils de Stella (construit une seule fois)."""
+    return get_llm().bind(tools=OPENAI_TOOL_SPECS, tool_choice="auto")
+
+# --- Cache des réponses du LLM ---
+# Avec temperature=0, des messages identiques donnent la même décision : les réponses de agent_node
+# sont mémorisées par empreinte des messages envoyés (ex: "Analyse AAPL" dans une nouvelle session),
+# tout comme les présentations de profil d'entreprise rédigées à partir du même JSON.
+# STELLA_LLM_CACHE=0 désactive le cache.
+LLM_CACHE_ENABLED = os.environ.get("STELLA_LLM_CACHE", "1") != "0"
+LLM_CACHE_MAX_ENTRIES = 256
+LLM_CACHE_TTL = 3600  # secondes
+_llm_response_cache = TTLCache(maxsize=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL)  # clé -> AIMessage
+
+def llm_cache_key(messages: List[BaseMessage]) -> str:
+    """Empreinte des messages envoyés au LLM : type, contenu et appels d'outils (sans leurs id, aléatoires)."""
+    payload = [
+        (
+            message.type,
+            message.content,
+            [(tool_call['name'], tool_call['args']) for tool_call in getattr(message, 'tool_calls', None) or ()],
+        )
+        for message in messages
+    ]
+    return hashlib.sha256(orjson.dumps(payload, default=str)).hexdigest()
+
+def llm_cache_get(key: str) -> Optional[AIMessage]:
+    """
+    Retourne une copie de la réponse mémorisée, sans id (add_messages en attribue un neuf) et avec de nouveaux
+    id d'appels d'outils : une réponse rejouée ne peut pas reprendre ceux déjà présents dans l'historique d'un thread.
+    """
+    cached = _llm_response_cache.get(key)
+    if cached is None:
+        return None
+    tool_calls = [{**tool_call, 'id': f"call_{uuid.uuid4().hex}"} for tool_call in cached.tool_calls]
+    # La forme OpenAI des appels (additional_kwargs) porterait encore les anciens id : seule tool_calls est gardée
+    additional_kwargs = {k: v for k, v in cached.additional_kwargs.items() if k != 'tool_calls'}
+    return cached.model_copy(
+        update={"id": None, "tool_calls": tool_calls, "additional_kwargs": additional_kwargs}, deep=True,
+    )
+
+def llm_cache_put(key: str, response: AIMessage) -> None:
+    _llm_response_cache.put(key, response.model_copy(deep=True))
+
+# Prompt de présentation du profil d'entreprise, compilé une seule fois
+PROFILE_PROMPT = ChatPromptTemplate.from_template("""
+    Voici les informations de profil pour une entreprise au format JSON :
+    {profile_json}
+    **INFORMATION CRUCIALE :**
+    TU DOIS rédiger une réponse formatée en markdown pour présenter ces informations à l'utilisateur EN FRANÇAIS.
+    Rédige une réponse la plus exhaustive et agréable possible pour présenter ces informations à l'utilisateur.
+    Mets en avant le nom de l'entreprise, son secteur et son CEO, mais n'omet aucune information qui n'est pas null dans le JSON.
+    Tu n'afficheras pas l'image du logo, l'UI s'en chargera, et tu n'as pas besoin de la mentionner.
+    Présente les informations de manière sobre en listant les points du JSON.
+    IMPORTANT: Si la description est déjà en français dans le JSON, utilise-la EXACTEMENT comme elle est écrite.
+    Si il y a un champ null, TU DOIS TOUJOURS le compléter via tes connaissances, sans inventer de données.
+    Si tu ne trouves pas d'informations, indique simplement "Inconnu" ou "Non disponible".
+    Termine en donnant le lien vers leur site web.
+    """)
+
+@functools.lru_cache(maxsize=1)
+def get_profile_chain():
+    """Retourne la chaîne prompt | LLM utilisée pour présenter le profil (construite une seule fois)."""
+    return PROFILE_PROMPT | get_llm()
+
+# Client LangSmith partagé, créé à la première utilisation (export des traces ou récupération)
+@functools.lru_cache(maxsize=1)
+def get_langsmith_client():
+    """
+    Retourne le client LangSmith partagé par le tracer du graphe et les fonctions de récupération de traces.
+    Les runs sont envoyés par lots depuis un thread d'arrière-plan (auto_batch_tracing) : l'export
+    ne se fait pas sur le chemin de la requête. L'échantillonnage porte sur les traces entières.
+    """
+    from langsmith import Client
+    return Client(auto_batch_tracing=True, tracing_sampling_rate=LANGSMITH_SAMPLE_RATE)
+
+def langsmith_tracing_enabled() -> bool:
+    """Sans tracing actif ni clé d'API, aucune trace ne peut exister : inutile d'interroger LangSmith."""
+    if os.environ.get("LANGCHAIN_TRACING_V2", "").lower() != "true":
+        return False
+    return bool(os.environ.get("LANGSMITH_API_KEY") or os.environ.get("LANGCHAIN_API_KEY"))
 
 # Objet AgentState pour stocker et modifier l'état de l'agent entre les nœuds
 class AgentState(TypedDict):
@@ -119,13 +261,169 @@ class AgentState(TypedDict):
     ticker: str
     tickers: List[str]
     company_name: str
-    fetched_df_json: str
-    processed_df_json: str
+    fetched_df_arrow: str    # Clé dans BLOB_CACHE du DataFrame brut (flux Arrow IPC)
+    processed_df_arrow: str  # Clé dans BLOB_CACHE du DataFrame prétraité (flux Arrow IPC)
+    fetched_columns: List[str]    # Colonnes de fetched_df_arrow, pour le contexte de l'agent
+    processed_columns: List[str]  # Colonnes de processed_df_arrow, pour le contexte de l'agent
     analysis: str
     plotly_json: str  
+    chart_warning: str  # Avertissement affiché avec le graphique (ex: tickers absents d'une comparaison)
+    last_comparison: dict  # Arguments du dernier appel à compare_stocks, pour les demandes de suivi
+    last_ai_toolcall_idx: int  # Position dans messages du dernier AIMessage avec appels d'outils
+    last_tool_msg_idx: int     # Position dans messages du dernier ToolMessage
+    current_chain_total: int     # Nombre d'appels d'outils demandés par le dernier AIMessage
+    current_chain_executed: int  # Nombre de ces appels déjà exécutés
     messages: Annotated[List[AnyMessage], add_messages]
     error: str
 
+# --- Sérialisation des DataFrames dans l'état ---
+# Les DataFrames transitent entre les outils sous forme de flux Arrow IPC (bytes) :
+# la reconstruction est quasi zéro-copie et les types sont préservés, contrairement au JSON.
+# Les flux eux-mêmes vivent dans BLOB_CACHE, un LRU plafonné propre au processus : l'état (et donc
+# chaque checkpoint du MemorySaver et chaque trace LangSmith) ne contient qu'une clé.
+BLOB_CACHE_MAX_ENTRIES = 128
+BLOB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+BLOB_CACHE = BlobCache(max_entries=BLOB_CACHE_MAX_ENTRIES, max_bytes=BLOB_CACHE_MAX_BYTES)
+
+def df_to_state(df: pd.DataFrame) -> str:
+    """Sérialise un DataFrame en flux Arrow IPC, le range dans BLOB_CACHE et retourne la clé à stocker dans l'état."""
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return BLOB_CACHE.put(sink.getvalue().to_pybytes())
+
+def state_has_df(ref) -> bool:
+    """Indique si la référence stockée dans l'état pointe encore vers des données disponibles."""
+    return isinstance(ref, (bytes, bytearray)) or (bool(ref) and ref in BLOB_CACHE)
+
+def _state_blob(ref) -> bytes:
+    """Résout une référence de l'état en flux Arrow IPC (les états sauvegardés avant le cache contiennent directement les bytes)."""
+    if isinstance(ref, (bytes, bytearray)):
+        return ref
+    blob = BLOB_CACHE.get(ref)
+    if blob is None:
+        raise ValueError("Les données ne sont plus disponibles en mémoire, il faut les récupérer à nouveau avec fetch_data.")
+    return blob
+
+def _blob_to_df(blob: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(blob).read_all().to_pandas(zero_copy_only=False)
+
+# Une clé de BLOB_CACHE désigne un contenu immuable : le DataFrame décodé peut être mémoïsé par clé.
+# Les mêmes données sont relues à plusieurs tours (analyse, graphique, réponse finale, affichage).
+@functools.lru_cache(maxsize=8)
+def _decoded_df(key: str) -> pd.DataFrame:
+    return _blob_to_df(_state_blob(key))
+
+def state_to_df(ref) -> pd.DataFrame:
+    """Reconstruit un DataFrame à partir de sa référence dans l'état (copie : l'appelant peut la modifier)."""
+    if isinstance(ref, (bytes, bytearray)):
+        return _blob_to_df(ref)
+    return _decoded_df(ref).copy()
+
+def state_columns(ref) -> List[str]:
+    """Retourne les colonnes d'un DataFrame sérialisé en ne lisant que le schéma Arrow."""
+    schema = pa.ipc.open_stream(_state_blob(ref)).schema
+    # Les colonnes d'index ajoutées par pandas ne sont pas des colonnes de données
+    index_columns = set()
+    if schema.pandas_metadata:
+        index_columns = {col for col in schema.pandas_metadata.get('index_columns', []) if isinstance(col, str)}
+    return [name for name in schema.names if name not in index_columns]
+
+def _json_default(obj: Any):
+    """Repli pour les objets qu'orjson ne sait pas sérialiser nativement (tableaux de type object, Timestamp...)."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type non sérialisable en JSON : {type(obj).__name__}")
+
+def _epoch_ms(values) -> list:
+    """Dates en millisecondes depuis l'epoch (None pour NaT), comme le format par défaut de DataFrame.to_json."""
+    values = pd.DatetimeIndex(values)
+    epoch = (values.asi8 // 1_000_000).tolist()
+    return [None if missing else ms for ms, missing in zip(epoch, values.isna())]
+
+def df_to_split_json(df: pd.DataFrame) -> str:
+    """
+    Sérialise un DataFrame au format JSON orient='split' attendu par le front-end.
+    orjson sur les listes Python est plusieurs fois plus rapide que DataFrame.to_json sur les DataFrames larges
+    (NaN et infinis deviennent null, comme avec pandas).
+    """
+    datetime_columns = df.select_dtypes(include=["datetime", "datetimetz"]).columns
+    if len(datetime_columns):
+        df = df.assign(**{col: pd.Series(_epoch_ms(df[col]), index=df.index, dtype=object) for col in datetime_columns})
+    index = _epoch_ms(df.index) if isinstance(df.index, pd.DatetimeIndex) else df.index.tolist()
+    return orjson.dumps(
+        {"columns": df.columns.tolist(), "index": index, "data": df.to_numpy(dtype=object).tolist()},
+        default=_json_default,
+    ).decode()
+
+def _fig_to_json(fig) -> str:
+    """
+    Sérialise une figure Plotly avec pio.to_json (moteur orjson, sans revalider la figure) :
+    les tableaux numpy numériques des traces y sont encodés en tableaux typés base64 ({'dtype', 'bdata'}).
+    Accepte aussi une figure déjà sous forme de dictionnaire {'data': [...], 'layout': {...}}, qui ne passe
+    pas par plotly : ses tableaux (quelques années pour le graphique de synthèse) restent des listes JSON.
+    """
+    if isinstance(fig, dict):
+        return orjson.dumps(
+            fig, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        ).decode()
+    import plotly.io as pio
+    return pio.to_json(fig, validate=False, engine="orjson")
+
+@functools.lru_cache(maxsize=1)
+def synthesis_layout() -> dict:
+    """
+    Layout complet du graphique de synthèse sous forme de dictionnaire, calculé une seule fois :
+    layout validé de chart_theme (template déplié) et ligne à zéro (équivalent de add_hline).
+    """
+    layout = plotly_layout('synthesis').to_plotly_json()
+    # Ligne à zéro pour mieux visualiser la croissance positive/négative
+    layout['shapes'] = [{
+        'type': 'line', 'xref': 'x domain', 'x0': 0, 'x1': 1, 'yref': 'y', 'y0': 0, 'y1': 0,
+        'line': {'color': 'black', 'dash': 'dash', 'width': 1},
+    }]
+    return layout
+
+# Au-delà de MAX_CHART_POINTS points, une courbe est réduite à CHART_DOWNSAMPLED_POINTS points par LTTB :
+# à la largeur d'un graphique, la forme reste la même et le JSON envoyé au navigateur est bien plus léger.
+MAX_CHART_POINTS = 2000
+CHART_DOWNSAMPLED_POINTS = 1000
+
+def _line_figure(df: pd.DataFrame, layout: str, title: str, x_title: str, y_title: str, markers: bool = False, webgl: bool = False):
+    """
+    Construit une courbe par colonne de `df` (index en abscisse) directement avec go.Scatter.
+    Les valeurs sont passées en tableaux numpy float64 (pleine précision des prix), sans passage par px.line.
+    Les séries plus longues que MAX_CHART_POINTS sont sous-échantillonnées (LTTB).
+    `layout` est le nom d'un des layouts précalculés de chart_theme ; seuls le titre et les libellés varient.
+    `webgl` utilise go.Scattergl, rendu en WebGL côté frontend, pour les longues séries de prix.
+    """
+    import plotly.graph_objects as go
+
+    colors = stella_theme['colors']
+    trace_type = go.Scattergl if webgl else go.Scatter
+    x_values = df.index.to_numpy()
+    fig = go.Figure(layout=plotly_layout(layout))
+    for i, column in enumerate(df.columns):
+        x_trace = x_values
+        y_trace = df[column].to_numpy(dtype=np.float64)
+        if len(y_trace) > MAX_CHART_POINTS:
+            kept = lttb_indices(y_trace, CHART_DOWNSAMPLED_POINTS)
+            x_trace, y_trace = x_values[kept], y_trace[kept]
+        fig.add_trace(trace_type(
+            x=x_trace,
+            y=y_trace,
+            name=str(column),
+            mode='lines+markers' if markers else 'lines',
+            line=dict(color=colors[i % len(colors)]),
+        ))
+    fig.update_layout(title_text=title, xaxis_title=x_title, yaxis_title=y_title)
+    return fig
+
 # --- Prompt système (définition du rôle de l'agent) ---
 system_prompt = """Ton nom est Stella. Tu es une assistante experte financière. Ton but principal est d'aider les utilisateurs en analysant des actions. Tu as été créée par une équipe de recherche dans le cadre du **Projet OPA**.
 
@@ -152,19 +450,8 @@ Tu dois impérativement comprendre et respecter ces deux règles :
 1.  **Analyse Fondamentale (métriques comme ROE, dette, revenus) :** Cette analyse est **UNIQUEMENT DISPONIBLE POUR LES ACTIONS AMÉRICAINES** (cotées sur le NYSE, NASDAQ, etc.). Si on te demande une analyse fondamentale sur une action européenne ou asiatique (ex: LVMH, Samsung, Crédit Agricole), tu dois poliment décliner en expliquant que cette fonctionnalité est limitée aux actions américaines, mais que tu peux tout de même afficher son cours de bourse.
 2.  **Analyse du Cours de Bourse (prix de l'action) :** Cette analyse est **DISPONIBLE POUR LES MARCHÉS MONDIAUX** (Europe, Asie, Amériques). Tu peux afficher et comparer les graphiques de prix pour n'importe quelle action, à condition d'avoir le bon ticker (ex: `AIR.PA` pour Airbus, `005930.KS` pour Samsung).
 
-**Liste des outils disponibles**
-1.  `search_ticker`: Recherche le ticker boursier d'une entreprise à partir de son nom. **À UTILISER EN DERNIER RECOURS UNIQUEMENT** si tu ne connais vraiment pas le ticker d'une entreprise connue.
-2.  `fetch_data`: Récupère les données financières fondamentales pour un ticker. **RAPPEL : Ne fonctionne que pour les actions américaines.**
-3.  `preprocess_data`: Prépare et nettoie les données financières. **RAPPEL : Ne fonctionne que sur les données américaines.**
-4.  `analyze_risks`: Prédit la performance d'une action. **RAPPEL : Ne fonctionne que sur les données américaines.**
-5.  `display_price_chart`: Affiche un graphique de l'évolution du prix (cours) d'une action. **Fonctionne pour les actions du monde entier.**
-6.  `display_raw_data`: Affiche les données financières brutes. **RAPPEL : Données américaines uniquement.**
-7.  `display_processed_data`: Affiche les données financières traitées. **RAPPEL : Données américaines uniquement.**
-8.  `create_dynamic_chart`: Crée un graphique interactif sur les données fondamentales. **RAPPEL : Données américaines uniquement.**
-9.  `get_stock_news`: Récupère les dernières actualités. **Fonctionne mieux pour les entreprises internationales.**
-10. `get_company_profile`: Récupère le profil d'une entreprise. **Fonctionne pour les entreprises internationales.**
-11. `compare_stocks`: Compare plusieurs entreprises sur une métrique financière ou sur leur prix. **Lis attentivement les instructions ci-dessous pour cet outil.**
-12. `query_research`: Recherche dans le rapport de projet via un système RAG pour trouver, expliquer ou résumer des informations liées au contexte et à la recherche du projet.
+**Outils disponibles**
+Les outils et leurs arguments te sont fournis avec leur description. Ceux qui portent sur les données fondamentales (`fetch_data`, `preprocess_data`, `analyze_risks`, `display_raw_data`, `display_processed_data`, `create_dynamic_chart`) ne fonctionnent que pour les actions américaines ; `display_price_chart`, `compare_stocks` (prix), `get_stock_news` et `get_company_profile` fonctionnent pour les entreprises du monde entier.
 
 **Formatage des appels d'outils**
 Tu dois toujours appeler les outils avec les arguments nécessaires, en respectant la structure suivante :
@@ -275,49 +562,135 @@ Fais TOUJOURS référence à **Stella comme toi même**.
 Fais attention au formatage de tes réponses, à toujours bien placer des balises markdown, afin de structurer tes réponses et les rendre agréables à lire.
 """
 
+# Le prompt système est constant : on construit le SystemMessage une seule fois.
+# Il est toujours envoyé en premier et à l'identique ; le marqueur cache_control (transmis tel quel
+# par OpenRouter aux fournisseurs qui le gèrent) en fait un préfixe mis en cache côté fournisseur.
+# Le contexte dynamique part dans un second SystemMessage pour ne pas casser ce préfixe.
+SYSTEM_MESSAGE = SystemMessage(content=[
+    {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}},
+])
+
+# Délimiteurs du bloc de contexte dynamique injecté à chaque tour
+CONTEXT_HEADER = "\n\n--- CONTEXTE ACTUEL ---\n"
+CONTEXT_FOOTER = "\n---------------------------------\n"
+
+@functools.lru_cache(maxsize=32)
+def columns_context(columns: tuple) -> str:
+    """
+    Ligne de contexte listant les colonnes disponibles, mémoïsée par ensemble de colonnes.
+    Noms séparés par des virgules plutôt que le repr d'une liste Python : sans les guillemets,
+    la soixantaine de colonnes du DataFrame prétraité coûte nettement moins de tokens à chaque tour.
+    """
+    return "Des données sont disponibles avec les colonnes : " + ", ".join(map(str, columns))
+
+# --- Bornage de l'historique de conversation ---
+# Le checkpointer garde tout l'historique du thread : sans limite, chaque tour renvoie une
+# conversation toujours plus longue au LLM et la sauvegarde de l'état grossit d'autant.
+MAX_HISTORY_TOKENS = 4000   # Budget (approximatif) des tours précédents envoyés au LLM
+MAX_STORED_MESSAGES = 40    # Nombre de messages conservés par thread dans le checkpointer
+
+def split_current_turn(messages: List[AnyMessage]):
+    """Sépare l'historique en (tours précédents, tour courant), le tour courant commençant au dernier HumanMessage."""
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return messages[:index], messages[index:]
+    return [], list(messages)
+
+def trim_history(messages: List[AnyMessage]) -> List[AnyMessage]:
+    """
+    Borne l'historique envoyé au LLM : le tour courant (question, appels d'outils et résultats)
+    est toujours gardé intact, les tours précédents sont tronqués aux plus récents dans le budget.
+    """
+    previous, current_turn = split_current_turn(messages)
+    budget = MAX_HISTORY_TOKENS - count_tokens_approximately(current_turn)
+    if not previous or budget <= 0:
+        return current_turn
+    previous = trim_messages(
+        previous,
+        max_tokens=budget,
+        strategy="last",
+        token_counter=count_tokens_approximately,
+        start_on="human",  # Ne jamais commencer au milieu d'un tour (ToolMessage orphelin)
+    )
+    return previous + current_turn
+
+def stale_messages(messages: List[AnyMessage]) -> List[RemoveMessage]:
+    """Retourne les suppressions des messages les plus anciens au-delà de MAX_STORED_MESSAGES, coupées sur un début de tour."""
+    if len(messages) <= MAX_STORED_MESSAGES:
+        return []
+    cut = len(messages) - MAX_STORED_MESSAGES
+    while cut < len(messages) and not isinstance(messages[cut], HumanMessage):
+        cut += 1
+    return [RemoveMessage(id=msg.id) for msg in messages[:cut] if msg.id]
+
+def _cached_message(state: AgentState, index_key: str, matches) -> Optional[AnyMessage]:
+    """
+    Retourne le message dont la position est mémorisée dans l'état sous `index_key`.
+    Repli sur un parcours de l'historique si l'index est absent ou ne correspond plus.
+    """
+    messages = state['messages']
+    index = state.get(index_key)
+    if index is not None and 0 <= index < len(messages) and matches(messages[index]):
+        return messages[index]
+    return next((msg for msg in reversed(messages) if matches(msg)), None)
+
+def last_tool_call_message(state: AgentState) -> Optional[AIMessage]:
+    """Dernier AIMessage contenant des appels d'outils."""
+    return _cached_message(state, "last_ai_toolcall_idx", lambda msg: isinstance(msg, AIMessage) and bool(msg.tool_calls))
+
+def last_tool_message(state: AgentState) -> Optional[ToolMessage]:
+    """Dernier ToolMessage de l'historique."""
+    return _cached_message(state, "last_tool_msg_idx", lambda msg: isinstance(msg, ToolMessage))
+
 # --- Définition des noeuds du Graph ---
 
 # Noeud 1 : agent_node, point d'entrée et appel du LLM 
-def agent_node(state: AgentState):
+async def agent_node(state: AgentState, config: RunnableConfig):
     """Le 'cerveau' de l'agent. Décide du prochain outil à appeler."""
-    print("\n--- AGENT: Décision de la prochaine étape... ---")
+    logger.info("AGENT: Décision de la prochaine étape...")
 
     # On commence par le prompt système pour donner le rôle
-    current_messages = [SystemMessage(content=system_prompt)]
+    current_messages = [SYSTEM_MESSAGE]
     
     # --- INJECTION DE CONTEXTE DYNAMIQUE ---
     context_parts = []
     
     # Contexte des données disponibles
-    data_to_inspect_json = state.get("processed_df_json") or state.get("fetched_df_json")
-    if data_to_inspect_json:
+    # BLOB_CACHE est borné et partagé par tout le processus, alors que le checkpointer garde les conversations 24h :
+    # une référence dont les données ont été évincées est effacée de l'état, avec ses colonnes,
+    # pour ne pas annoncer au LLM des données que les outils ne peuvent plus lire.
+    stale_updates = {}
+    for prefix in ("fetched", "processed"):
+        ref = state.get(f"{prefix}_df_arrow")
+        if ref and not state_has_df(ref):
+            logger.info("AGENT: Données '%s' évincées du cache, référence retirée de l'état.", prefix)
+            stale_updates[f"{prefix}_df_arrow"] = ""
+            stale_updates[f"{prefix}_columns"] = []
+    live_state = {**state, **stale_updates}
+
+    # Les colonnes sont mises en cache dans l'état par les outils, sans relire le DataFrame.
+    # Repli sur le schéma Arrow pour les états sauvegardés avant l'ajout de ce cache.
+    available_columns = live_state.get("processed_columns") or live_state.get("fetched_columns")
+    data_to_inspect = live_state.get("processed_df_arrow") or live_state.get("fetched_df_arrow")
+    if not available_columns and data_to_inspect:
         try:
-            df = pd.read_json(StringIO(data_to_inspect_json), orient='split')
-            available_columns = df.columns.tolist()
-            context_parts.append(f"Des données sont disponibles avec les colonnes : {available_columns}")
+            available_columns = state_columns(data_to_inspect)
         except Exception as e:
-            print(f"Avertissement: Impossible d'injecter le contexte des colonnes. Erreur: {e}")
+            logger.warning("Impossible d'injecter le contexte des colonnes. Erreur: %s", e)
+    if available_columns:
+        context_parts.append(columns_context(tuple(available_columns)))
     
     # Contexte des tickers dans une comparaison en cours
     current_tickers = state.get("tickers")
     if current_tickers and len(current_tickers) > 1:
         context_parts.append(f"COMPARAISON EN COURS : {current_tickers}")
         
-        # Déterminer le type de comparaison basé sur le dernier message d'outil
-        last_tool_call = None
-        for msg in reversed(state['messages']):
-            if isinstance(msg, AIMessage) and msg.tool_calls:
-                for tool_call in msg.tool_calls:
-                    if tool_call['name'] == 'compare_stocks':
-                        last_tool_call = tool_call
-                        break
-                if last_tool_call:
-                    break
-        
-        if last_tool_call:
-            comparison_type = last_tool_call['args'].get('comparison_type', 'price')
-            metric = last_tool_call['args'].get('metric', 'price')
-            period_days = last_tool_call['args'].get('period_days', 252)
+        # Déterminer le type de comparaison à partir du dernier appel mémorisé dans l'état
+        last_comparison = state.get("last_comparison")
+        if last_comparison:
+            comparison_type = last_comparison.get('comparison_type', 'price')
+            metric = last_comparison.get('metric', 'price')
+            period_days = last_comparison.get('period_days', 252)
             
             context_parts.append(f"Type de comparaison actuelle : {comparison_type}")
             context_parts.append(f"Métrique comparée : {metric}")
@@ -335,298 +708,376 @@ def agent_node(state: AgentState):
         context_parts.append(f"ANALYSE INDIVIDUELLE EN COURS : {current_ticker}")
         context_parts.append(f"Si l'utilisateur demande d'analyser un nouveau ticker, tu DOIS faire une nouvelle analyse complète avec fetch_data, preprocess_data, analyze_risks.")
     
+    # Tickers résolus localement dans la nouvelle demande : évite un appel à search_ticker pour les entreprises connues
+    last_message = state['messages'][-1] if state['messages'] else None
+    if isinstance(last_message, HumanMessage) and isinstance(last_message.content, str):
+        resolved_tickers = resolve_tickers(last_message.content)
+        if resolved_tickers:
+            resolved = ", ".join(f"{name} = {ticker}" for name, ticker in resolved_tickers.items())
+            context_parts.append(f"Ticker résolu : {resolved} (inutile d'appeler search_ticker pour ces entreprises)")
+    
     if context_parts:
         context_message = SystemMessage(
-            content=(
-                f"\n\n--- CONTEXTE ACTUEL ---\n"
-                + "\n".join(context_parts) +
-                f"\n---------------------------------\n"
-            )
+            content=CONTEXT_HEADER + "\n".join(context_parts) + CONTEXT_FOOTER
         )
         current_messages.append(context_message)
 
-    # On ajoute l'historique de la conversation depuis l'état
-    current_messages.extend(state['messages'])
+    # On ajoute l'historique de la conversation depuis l'état, borné en tokens
+    current_messages.extend(trim_history(state['messages']))
     
-    # 🧠 MEMORY DEBUG: Show conversation history being used
-    conversation_history = [msg for msg in state['messages'] if isinstance(msg, (HumanMessage, AIMessage)) and hasattr(msg, 'content')]
-    print(f"🧠 [MEMORY] Using conversation history: {len(conversation_history)} messages")
-    for i, msg in enumerate(conversation_history[-3:]):  # Show last 3 messages
-        msg_type = "Human" if isinstance(msg, HumanMessage) else "AI"
-        content_preview = (msg.content or "")[:100] + "..." if len(msg.content or "") > 100 else (msg.content or "")
-        print(f"   [{i+1}] {msg_type}: {content_preview}")
+    # 🧠 MEMORY DEBUG : aperçu de l'historique, construit seulement si le niveau DEBUG est actif
+    if logger.isEnabledFor(logging.DEBUG):
+        conversation_history = [msg for msg in state['messages'] if isinstance(msg, (HumanMessage, AIMessage)) and hasattr(msg, 'content')]
+        logger.debug("[MEMORY] Historique de conversation : %d messages", len(conversation_history))
+        for i, msg in enumerate(conversation_history[-3:]):  # Les 3 derniers messages
+            msg_type = "Human" if isinstance(msg, HumanMessage) else "AI"
+            logger.debug("   [%d] %s: %.100s", i + 1, msg_type, msg.content or "")
 
     # 🕐 TIMING: Start measuring LLM inference time
-    import time
-    llm_start_time = time.time()
-    print(f"⏱️  [LLM] Starting inference call to {OPENROUTER_MODEL}...")
+    llm_start_ns = time.perf_counter_ns()
+    logger.debug("[LLM] Début de l'inférence sur %s...", OPENROUTER_MODEL)
     
-    # On invoque le LLM avec la liste de messages complète
-    # Cette liste est locale et ne modifie pas l'état directement
-    response = llm.bind_tools(available_tools).invoke(current_messages)
+    # On invoque le LLM en streaming avec la liste de messages complète
+    # Cette liste est locale et ne modifie pas l'état directement.
+    # Les tokens remontent au fil de l'eau (stream_mode="messages" côté API) et on recompose la réponse complète.
+    # La config du nœud est transmise explicitement : avant Python 3.11, LangGraph ne la propage pas par contextvars
+    # aux nœuds asynchrones, et sans elle ni le streaming des tokens ni le tracing ne voient l'appel au LLM.
+    # Une réponse déjà calculée pour exactement les mêmes messages est réutilisée sans appel réseau
+    # (l'API la diffuse alors en une fois, comme tout message qui n'a pas été streamé)
+    cache_key = llm_cache_key(current_messages) if LLM_CACHE_ENABLED else None
+    response = llm_cache_get(cache_key) if cache_key else None
+    cache_hit = response is not None
+    if not cache_hit:
+        async for chunk in get_llm_with_tools().astream(current_messages, config=config):
+            response = chunk if response is None else response + chunk
+        response = message_chunk_to_message(response) if response is not None else AIMessage(content="")
+        if cache_key and (response.content or response.tool_calls) and not response.invalid_tool_calls:
+            llm_cache_put(cache_key, response)
     
     # 🕐 TIMING: End measuring LLM inference time
-    llm_end_time = time.time()
-    llm_duration = llm_end_time - llm_start_time
-    print(f"⏱️  [LLM] Inference completed in {llm_duration:.2f} seconds")
+    llm_duration_ns = time.perf_counter_ns() - llm_start_ns
+    logger.info(
+        "[LLM] Inférence terminée en %.2f secondes%s", llm_duration_ns / 1e9, " (cache)" if cache_hit else "",
+        extra={"event": "llm_done", "model": OPENROUTER_MODEL, "duration_ns": llm_duration_ns, "cache_hit": cache_hit},
+    )
     
-    print(f"response.content: {response.content}")
-    return {"messages": [response]}
+    logger.debug("response.content: %s", response.content)
+
+    # Au début d'un nouveau tour, on purge de l'état les messages les plus anciens
+    # pour que l'historique sauvegardé par le checkpointer reste borné
+    removals = stale_messages(state['messages']) if isinstance(state['messages'][-1], HumanMessage) else []
+    updates = {"messages": removals + [response], **stale_updates}
+    if response.tool_calls:
+        # Position de la réponse une fois les suppressions appliquées, pour le routeur et les noeuds d'affichage
+        updates["last_ai_toolcall_idx"] = len(state['messages']) - len(removals)
+        # Nouvelle chaîne d'outils : le compteur repart de zéro
+        updates["current_chain_total"] = len(response.tool_calls)
+        updates["current_chain_executed"] = 0
+    return updates
+
+# --- Handlers des outils ---
+# Chaque outil a son propre handler, enregistré dans TOOL_HANDLERS : execute_tool_node fait une
+# simple recherche dans ce dictionnaire au lieu de parcourir une longue chaîne de if/elif.
+# Signature commune : (tool_args, view, tool_id) -> (ToolMessage, mises à jour de l'état)
+# `view` est un ChainMap(mises à jour déjà produites, état) : les résultats des outils précédents
+# du même message masquent l'état initial, sans copier l'état ni chaîner les .get().
+
+async def _handle_search_ticker(tool_args, view, tool_id):
+    company_name = tool_args.get("company_name")
+    ticker = await asyncio.to_thread(_search_ticker_logic, company_name=company_name)
+    # On stocke le ticker ET le nom de l'entreprise
+    updates = {"ticker": ticker, "company_name": company_name}
+    return ToolMessage(tool_call_id=tool_id, content=f"[Ticker `{ticker}` trouvé.]"), updates
+
+async def _handle_fetch_data(tool_args, view, tool_id):
+    try:
+        output_df = await asyncio.to_thread(_fetch_data_logic, ticker=tool_args.get("ticker"))
+    except APILimitError:
+        user_friendly_error = "Désolé, il semble que j'aie un problème d'accès à mon fournisseur de données. Peux-tu réessayer plus tard ?"
+        return ToolMessage(tool_call_id=tool_id, content=json.dumps({"error": user_friendly_error})), {"error": user_friendly_error}
+    updates = {
+        "fetched_df_arrow": df_to_state(output_df),
+        "fetched_columns": output_df.columns.tolist(),
+        "ticker": tool_args.get("ticker"),
+    }
+    return ToolMessage(tool_call_id=tool_id, content="[Données récupérées avec succès.]"), updates
+
+async def _handle_get_stock_news(tool_args, view, tool_id):
+    # 1. On cherche le ticker dans les arguments fournis par le LLM, SINON dans l'état.
+    ticker = tool_args.get("ticker") or view.get("ticker")
+
+    # 2. Si après tout ça, on n'a toujours pas de ticker, c'est une vraie erreur.
+    if not ticker:
+        raise ValueError("Impossible de déterminer un ticker pour chercher les nouvelles, ni dans la commande, ni dans le contexte.")
+
+    # 3. On fait pareil pour le nom de l'entreprise (qui est optionnel mais utile)
+    # On utilise le ticker comme nom si on n'a rien d'autre.
+    company_name = tool_args.get("company_name") or view.get("company_name") or ticker
+
+    # 4. On appelle la logique avec les bonnes informations.
+    news_summary = await asyncio.to_thread(
+        _fetch_recent_news_logic,
+        ticker=ticker,
+        company_name=company_name
+    )
+
+    # 5. On met à jour l'état avec les informations du ticker et de l'entreprise
+    updates = {"ticker": ticker, "company_name": company_name}
+    return ToolMessage(tool_call_id=tool_id, content=news_summary), updates
+
+async def _handle_preprocess_data(tool_args, view, tool_id):
+    fetched_df_arrow = view.get("fetched_df_arrow")
+    if not fetched_df_arrow:
+        raise ValueError("Impossible de prétraiter les données car elles n'ont pas encore été récupérées.")
+    fetched_df = state_to_df(fetched_df_arrow)
+    output = _preprocess_data_logic(df=fetched_df)
+    updates = {
+        "processed_df_arrow": df_to_state(output),
+        "processed_columns": output.columns.tolist(),
+    }
+    return ToolMessage(tool_call_id=tool_id, content="[Données prétraitées avec succès.]"), updates
+
+async def _handle_analyze_risks(tool_args, view, tool_id):
+    processed_df_arrow = view.get("processed_df_arrow")
+    if not processed_df_arrow:
+        raise ValueError("Impossible de faire une prédiction car les données n'ont pas encore été prétraitées.")
+    processed_df = state_to_df(processed_df_arrow)
+    output = await asyncio.to_thread(_analyze_risks_logic, processed_data=processed_df)
+    return ToolMessage(tool_call_id=tool_id, content=output), {"analysis": output}
+
+async def _handle_create_dynamic_chart(tool_args, view, tool_id):
+    # Données prétraitées en priorité, sinon données brutes
+    data_for_chart = view.get("processed_df_arrow") or view.get("fetched_df_arrow")
+    if not data_for_chart:
+        raise ValueError("Aucune donnée disponible pour créer un graphique.")
+
+    # On reconstruit le DataFrame depuis le flux Arrow
+    df_for_chart = state_to_df(data_for_chart)
+
+    chart_json = _create_dynamic_chart_logic(
+        data=df_for_chart,  # <--- Le DataFrame est passé directement
+        chart_type=tool_args.get('chart_type'),
+        x_column=tool_args.get('x_column'),
+        y_column=tool_args.get('y_column'),
+        title=tool_args.get('title'),
+        color_column=tool_args.get('color_column')
+    )
+
+    if "Erreur" in chart_json:
+        raise ValueError(chart_json) # Transforme l'erreur de l'outil en exception
+
+    return ToolMessage(tool_call_id=tool_id, content="[Graphique interactif créé.]"), {"plotly_json": chart_json}
+
+# Outils d'affichage de données : clé de l'état à afficher et message d'introduction associé
+DISPLAY_KEYS = {
+    "display_raw_data": "fetched_df_arrow",
+    "display_processed_data": "processed_df_arrow",
+}
+DISPLAY_MESSAGES = {
+    "display_raw_data": "Voici les données **brutes** que tu as demandées :",
+    "display_processed_data": "Voici les données **pré-traitées** que tu as demandées :",
+}
+
+async def _handle_display_data(state_key, tool_args, view, tool_id):
+    # Vérifie la disponibilité des données en tenant compte de la chaîne d'outils en cours
+    if not view.get(state_key):
+        raise ValueError("Aucune donnée disponible à afficher.")
+    # Rien à renvoyer ici, on laisse le noeud prepare_data_display attacher le bon DataFrame
+    return ToolMessage(tool_call_id=tool_id, content="[Préparation de l'affichage des données.]"), {}
+
+async def _handle_get_company_profile(tool_args, view, tool_id):
+    ticker = tool_args.get("ticker")
+    profile_json = await asyncio.to_thread(_fetch_profile_logic, ticker=ticker)
+    return ToolMessage(tool_call_id=tool_id, content=profile_json), {}
+
+async def _handle_display_price_chart(tool_args, view, tool_id):
+    ticker = tool_args.get("ticker")
+    period = tool_args.get("period_days", 252) # Utilise la valeur par défaut si non fournie
+
+    # On appelle notre logique pour récupérer les données de prix
+    price_df = await asyncio.to_thread(_fetch_price_history_logic, ticker=ticker, period_days=period)
+
+    # On crée le graphique directement ici
+    fig = _line_figure(
+        price_df[['close']],
+        'price',
+        title=f"Historique du cours de `{ticker.upper()}` sur {period} jours",
+        x_title="Date",
+        y_title="Prix de clôture (USD)",
+        webgl=True,
+    )
+
+    # On convertit en JSON et on met à jour l'état
+    chart_json = _fig_to_json(fig)
+    return ToolMessage(tool_call_id=tool_id, content="[Graphique de prix créé avec succès.]"), {"plotly_json": chart_json}
+
+async def _handle_compare_stocks(tool_args, view, tool_id):
+    tickers = tool_args.get("tickers")
+    metric = tool_args.get("metric")
+    comparison_type = tool_args.get("comparison_type", "fundamental")
+
+    if comparison_type == 'fundamental':
+        # On appelle la fonction qui retourne l'historique
+        comp_df = await asyncio.to_thread(_compare_fundamental_metrics_logic, tickers=tickers, metric=metric)
+        fig = _line_figure(
+            comp_df,
+            'compare',
+            title=f"Évolution de la métrique '{metric.upper()}'",
+            x_title="Année",
+            y_title=metric.upper(),
+            markers=True, # Les marqueurs sont utiles pour voir les points de données annuels
+        )
+    elif comparison_type == 'price':
+        # La logique pour le prix ne change pas, elle est déjà une évolution
+        period = tool_args.get("period_days", 252)
+        comp_df = await asyncio.to_thread(_compare_price_histories_logic, tickers=tickers, period_days=period)
+        fig = _line_figure(
+            comp_df,
+            'compare',
+            title="Comparaison de la performance des actions (Base 100)",
+            x_title="Date",
+            y_title="Performance Normalisée (Base 100)",
+            webgl=True,
+        )
+    else:
+        raise ValueError(f"Type de comparaison inconnu: {comparison_type}")
+
+    # Tickers qui n'ont pas pu être récupérés : signalés à l'utilisateur plutôt qu'omis en silence
+    missing_tickers = comp_df.attrs.get('missing_tickers') or []
+    chart_warning = ""
+    if missing_tickers:
+        chart_warning = f"Je n'ai pas pu récupérer les données de {', '.join(f'`{ticker}`' for ticker in missing_tickers)} : ils n'apparaissent pas dans la comparaison."
+        logger.warning("compare_stocks : tickers manquants %s", missing_tickers)
+
+    updates = {
+        "plotly_json": _fig_to_json(fig),
+        "chart_warning": chart_warning,
+        "tickers": tickers,
+        # On mémorise les arguments pour que agent_node n'ait pas à parcourir l'historique
+        "last_comparison": {
+            key: tool_args[key]
+            for key in ("tickers", "metric", "comparison_type", "period_days")
+            if key in tool_args
+        },
+    }
+    content = "[Graphique de comparaison créé.]"
+    if missing_tickers:
+        content = f"[Graphique de comparaison créé sans {', '.join(missing_tickers)} : données indisponibles.]"
+    return ToolMessage(tool_call_id=tool_id, content=content), updates
+
+@functools.lru_cache(maxsize=1)
+def get_query_research_logic():
+    """Importe la recherche PDF à la première utilisation (initialisation lente), puis la garde en mémoire."""
+    from src.pdf_research import query_research_document
+    return query_research_document
+
+async def _handle_query_research(tool_args, view, tool_id):
+    query = tool_args.get("query")
+    research_result = await asyncio.to_thread(get_query_research_logic(), query=query)
+    return ToolMessage(tool_call_id=tool_id, content=research_result), {}
+
+TOOL_HANDLERS = {
+    "search_ticker": _handle_search_ticker,
+    "fetch_data": _handle_fetch_data,
+    "get_stock_news": _handle_get_stock_news,
+    "preprocess_data": _handle_preprocess_data,
+    "analyze_risks": _handle_analyze_risks,
+    "create_dynamic_chart": _handle_create_dynamic_chart,
+    **{name: functools.partial(_handle_display_data, state_key) for name, state_key in DISPLAY_KEYS.items()},
+    "get_company_profile": _handle_get_company_profile,
+    "display_price_chart": _handle_display_price_chart,
+    "compare_stocks": _handle_compare_stocks,
+    "query_research": _handle_query_research,
+}
+
+# Nœud vers lequel le routeur envoie une fois la chaîne d'outils terminée, selon le dernier outil appelé.
+# Les outils absents (search_ticker, fetch_data, preprocess_data...) renvoient vers l'agent.
+TOOL_TO_NODE = {
+    'analyze_risks': "generate_final_response",
+    'compare_stocks': "prepare_chart_display",
+    'display_price_chart': "prepare_chart_display",
+    'create_dynamic_chart': "prepare_chart_display",
+    'display_raw_data': "prepare_data_display",
+    'display_processed_data': "prepare_data_display",
+    'get_stock_news': "prepare_news_display",
+    'get_company_profile': "prepare_profile_display",
+}
+
+# Outils sans dépendance sur les données produites par les autres outils du même message :
+# ils sont lancés en parallèle, pendant que la chaîne fetch -> preprocess -> analyze s'exécute en séquence.
+INDEPENDENT_TOOLS = {"get_stock_news", "get_company_profile", "display_price_chart", "compare_stocks", "query_research"}
+
+async def _run_tool_call(tool_call, view):
+    """Exécute un appel d'outil et retourne (ToolMessage, mises à jour de l'état), erreurs comprises."""
+    tool_name = tool_call['name']
+    tool_args = tool_call['args']
+    tool_id = tool_call['id']
+    logger.info("Le LLM a décidé d'appeler le tool : %s - avec les arguments : %s", tool_name, tool_args)
+
+    # 🕐 TIMING: Start measuring tool execution time
+    tool_start_ns = time.perf_counter_ns()
+    logger.debug("[TOOL] Début de l'exécution de '%s'...", tool_name)
+
+    try:
+        handler = TOOL_HANDLERS.get(tool_name)
+        if handler is None:
+            raise ValueError(f"Outil inconnu : {tool_name}")
+        tool_message, updates = await handler(tool_args, view, tool_id)
+
+    except Exception as e:
+        # Bloc de capture générique pour toutes les autres erreurs
+        error_msg = f"Erreur lors de l'exécution de l'outil '{tool_name}': {repr(e)}"
+        tool_message = ToolMessage(tool_call_id=tool_id, content=f"[ERREUR: {error_msg}]")
+        updates = {"error": error_msg}
+        logger.error(error_msg)
+
+    # 🕐 TIMING: End measuring tool execution time
+    tool_duration_ns = time.perf_counter_ns() - tool_start_ns
+    logger.info(
+        "[TOOL] '%s' terminé en %.2f secondes", tool_name, tool_duration_ns / 1e9,
+        extra={"event": "tool_done", "tool": tool_name, "duration_ns": tool_duration_ns},
+    )
+    return tool_message, updates
 
 # Noeud 2 : execute_tool_node, exécute les outils en se basant sur la décision de l'agent_node (Noeud 1).
-def execute_tool_node(state: AgentState):
+async def execute_tool_node(state: AgentState):
     """Le "pont" qui exécute la logique réelle et met à jour l'état."""
-    print("\n--- OUTILS: Exécution d'un outil ---")
-    action_message = next((msg for msg in reversed(state['messages']) if isinstance(msg, AIMessage) and msg.tool_calls), None)
+    logger.info("OUTILS: Exécution d'un outil")
+    action_message = last_tool_call_message(state)
     if not action_message:
         raise ValueError("Aucun appel d'outil trouvé dans le dernier AIMessage.")
 
-    tool_outputs = []
+    tool_calls = action_message.tool_calls
+    results = [None] * len(tool_calls)
     current_state_updates = {}
-    
-    # Create a working copy of state that gets updated as we execute tools
-    working_state = state.copy()
-    
-    # On gère le cas où plusieurs outils sont appelés, bien que ce soit rare ici.
-    for tool_call in action_message.tool_calls:
-        tool_name = tool_call['name']
-        tool_args = tool_call['args']
-        tool_id = tool_call['id']
-        print(f"Le LLM a décidé d'appeler le tool : {tool_name} - avec les arguments : {tool_args}")
-        
-        # 🕐 TIMING: Start measuring tool execution time
-        import time
-        tool_start_time = time.time()
-        print(f"⏱️  [TOOL] Starting execution of '{tool_name}'...")
 
-        try:
-            if tool_name == "search_ticker":
-                company_name = tool_args.get("company_name")
-                ticker = _search_ticker_logic(company_name=company_name)
-                # On stocke le ticker ET le nom de l'entreprise
-                current_state_updates["ticker"] = ticker
-                current_state_updates["company_name"] = company_name 
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content=f"[Ticker `{ticker}` trouvé.]"))
-
-            elif tool_name == "fetch_data":
-                try:
-                    output_df = _fetch_data_logic(ticker=tool_args.get("ticker"))
-                    current_state_updates["fetched_df_json"] = output_df.to_json(orient='split')
-                    current_state_updates["ticker"] = tool_args.get("ticker")
-                    # Update working state immediately for next tool
-                    working_state["fetched_df_json"] = current_state_updates["fetched_df_json"]
-                    working_state["ticker"] = current_state_updates["ticker"]
-                    tool_outputs.append(ToolMessage(tool_call_id=tool_id, content="[Données récupérées avec succès.]"))
-                except APILimitError as e:
-                    user_friendly_error = "Désolé, il semble que j'aie un problème d'accès à mon fournisseur de données. Peux-tu réessayer plus tard ?"
-                    tool_outputs.append(ToolMessage(tool_call_id=tool_id, content=json.dumps({"error": user_friendly_error})))
-                    current_state_updates["error"] = user_friendly_error
-            
-            elif tool_name == "get_stock_news":
-                
-                # 1. On cherche le ticker dans les arguments fournis par le LLM, SINON dans l'état.
-                ticker = tool_args.get("ticker") or state.get("ticker")
-                
-                # 2. Si après tout ça, on n'a toujours pas de ticker, c'est une vraie erreur.
-                if not ticker:
-                    raise ValueError("Impossible de déterminer un ticker pour chercher les nouvelles, ni dans la commande, ni dans le contexte.")
-                
-                # 3. On fait pareil pour le nom de l'entreprise (qui est optionnel mais utile)
-                # On utilise le ticker comme nom si on n'a rien d'autre.
-                company_name = tool_args.get("company_name") or state.get("company_name") or ticker
-                
-                # 4. On appelle la logique avec les bonnes informations.
-                news_summary = _fetch_recent_news_logic(
-                    ticker=ticker, 
-                    company_name=company_name
-                )
-
-                # 5. On met à jour l'état avec les informations du ticker et de l'entreprise
-                current_state_updates["ticker"] = ticker
-                current_state_updates["company_name"] = company_name
-
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content=news_summary))
-                
-            elif tool_name == "preprocess_data":
-                # Check working state first, then fall back to original state
-                fetched_df_json = current_state_updates.get("fetched_df_json") or working_state.get("fetched_df_json")
-                if not fetched_df_json:
-                    raise ValueError("Impossible de prétraiter les données car elles n'ont pas encore été récupérées.")
-                fetched_df = pd.read_json(StringIO(fetched_df_json), orient='split')
-                output = _preprocess_data_logic(df=fetched_df)
-                current_state_updates["processed_df_json"] = output.to_json(orient='split')
-                # Update working state immediately for next tool
-                working_state["processed_df_json"] = current_state_updates["processed_df_json"]
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content="[Données prétraitées avec succès.]"))
-
-            elif tool_name == "analyze_risks":
-                # Check working state first, then fall back to original state  
-                processed_df_json = current_state_updates.get("processed_df_json") or working_state.get("processed_df_json")
-                if not processed_df_json:
-                    raise ValueError("Impossible de faire une prédiction car les données n'ont pas encore été prétraitées.")
-                processed_df = pd.read_json(StringIO(processed_df_json), orient='split')
-                output = _analyze_risks_logic(processed_data=processed_df)
-                current_state_updates["analysis"] = output
-                # Update working state immediately for potential next tool
-                working_state["analysis"] = current_state_updates["analysis"]
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content=output))
-            
-            elif tool_name == "create_dynamic_chart":
-                # Check working state first for data access in tool chains
-                data_json_for_chart = (
-                    current_state_updates.get("processed_df_json") or 
-                    working_state.get("processed_df_json") or 
-                    current_state_updates.get("fetched_df_json") or 
-                    working_state.get("fetched_df_json")
-                )
-                if not data_json_for_chart:
-                    raise ValueError("Aucune donnée disponible pour créer un graphique.")
-                
-                # On convertit le JSON en DataFrame
-                df_for_chart = pd.read_json(StringIO(data_json_for_chart), orient='split')
-                
-                chart_json = _create_dynamic_chart_logic(
-                    data=df_for_chart,  # <--- Le DataFrame est passé directement
-                    chart_type=tool_args.get('chart_type'),
-                    x_column=tool_args.get('x_column'),
-                    y_column=tool_args.get('y_column'),
-                    title=tool_args.get('title'),
-                    color_column=tool_args.get('color_column')
-                )
-                
-                
-                if "Erreur" in chart_json:
-                    raise ValueError(chart_json) # Transforme l'erreur de l'outil en exception
-                
-                current_state_updates["plotly_json"] = chart_json
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content="[Graphique interactif créé.]"))
-
-            elif tool_name in ["display_raw_data", "display_processed_data"]:
-                # Vérifie la disponibilité des données en tenant compte de la chaîne d'outils en cours
-                if tool_name == "display_raw_data":
-                    df_json = (
-                        current_state_updates.get("fetched_df_json") or
-                        working_state.get("fetched_df_json") or
-                        state.get("fetched_df_json")
-                    )
-                else:  # display_processed_data
-                    df_json = (
-                        current_state_updates.get("processed_df_json") or
-                        working_state.get("processed_df_json") or
-                        state.get("processed_df_json")
-                    )
-
-                if not df_json:
-                    raise ValueError("Aucune donnée disponible à afficher.")
-
-                # Rien à renvoyer ici, on laisse le noeud prepare_data_display attacher le bon DataFrame
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content="[Préparation de l'affichage des données.]"))
-
-            elif tool_name == "get_company_profile":
-                ticker = tool_args.get("ticker")
-                profile_json = _fetch_profile_logic(ticker=ticker)
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content=profile_json))
-            
-            elif tool_name == "display_price_chart":
-                ticker = tool_args.get("ticker")
-                period = tool_args.get("period_days", 252) # Utilise la valeur par défaut si non fournie
-                
-                # On appelle notre logique pour récupérer les données de prix
-                price_df = _fetch_price_history_logic(ticker=ticker, period_days=period)
-                
-                # On crée le graphique directement ici
-                fig = px.line(
-                    price_df, 
-                    x=price_df.index, 
-                    y='close', 
-                    title=f"Historique du cours de `{ticker.upper()}` sur {period} jours",
-                    color_discrete_sequence=stella_theme['colors']
-
-                )
-                fig.update_layout(
-                    template=stella_theme['template'], 
-                    font=stella_theme['font'], 
-                    xaxis_title="Date", 
-                    yaxis_title="Prix de clôture (USD)",
-                    xaxis=stella_theme['axis_config'],
-                    yaxis=stella_theme['axis_config'],
-                    legend=dict(
-                        bordercolor="rgba(0, 0, 0, 0)",  # Pas de bordure
-                        borderwidth=0
-                    )
-                )
-                
-                # On convertit en JSON et on met à jour l'état
-                chart_json = pio.to_json(fig)
-                current_state_updates["plotly_json"] = chart_json
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content="[Graphique de prix créé avec succès.]"))
-
-            elif tool_name == "compare_stocks":
-                tickers = tool_args.get("tickers")
-                metric = tool_args.get("metric")
-                comparison_type = tool_args.get("comparison_type", "fundamental")
-
-                if comparison_type == 'fundamental':
-                    # On appelle la fonction qui retourne l'historique
-                    comp_df = _compare_fundamental_metrics_logic(tickers=tickers, metric=metric)
-                    fig = px.line(
-                        comp_df,
-                        x=comp_df.index,
-                        y=comp_df.columns,
-                        title=f"Évolution de la métrique '{metric.upper()}'",
-                        labels={'value': metric.upper(), 'variable': 'Ticker', 'calendarYear': 'Année'},
-                        markers=True, # Les marqueurs sont utiles pour voir les points de données annuels
-                        color_discrete_sequence=stella_theme['colors']  # Utilise la palette de couleurs Stella
-                    )
-                elif comparison_type == 'price':
-                    # La logique pour le prix ne change pas, elle est déjà une évolution
-                    period = tool_args.get("period_days", 252)
-                    comp_df = _compare_price_histories_logic(tickers=tickers, period_days=period)
-                    fig = px.line(
-                        comp_df,
-                        title=f"Comparaison de la performance des actions (Base 100)",
-                        labels={'value': 'Performance Normalisée (Base 100)', 'variable': 'Ticker', 'index': 'Date'},
-                        color_discrete_sequence=stella_theme['colors']
-                    )
-                else:
-                    raise ValueError(f"Type de comparaison inconnu: {comparison_type}")
-
-                # Le reste du code est commun et ne change pas
-                fig.update_layout(
-                    template="plotly_white",
-                    xaxis=stella_theme['axis_config'],
-                    yaxis=stella_theme['axis_config'],
-                    legend=dict(
-                        bordercolor="rgba(0, 0, 0, 0)",  # Pas de bordure
-                        borderwidth=0
-                    )
-                )
-                chart_json = pio.to_json(fig)
-                current_state_updates["plotly_json"] = chart_json
-                current_state_updates["tickers"] = tickers
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content="[Graphique de comparaison créé.]"))
-            
-            elif tool_name == "query_research":
-                query = tool_args.get("query")
-                # Lazy import to avoid initialization delays
-                from src.pdf_research import query_research_document as _query_research_document_logic
-                research_result = _query_research_document_logic(query=query)
-                tool_outputs.append(ToolMessage(tool_call_id=tool_id, content=research_result))
-            
-        except Exception as e:
-            # Bloc de capture générique pour toutes les autres erreurs
-            error_msg = f"Erreur lors de l'exécution de l'outil '{tool_name}': {repr(e)}"
-            tool_outputs.append(ToolMessage(tool_call_id=tool_id, content=f"[ERREUR: {error_msg}]"))
-            current_state_updates["error"] = error_msg
-            print(error_msg)
-        
-        # 🕐 TIMING: End measuring tool execution time
-        tool_end_time = time.time()
-        tool_duration = tool_end_time - tool_start_time
-        print(f"⏱️  [TOOL] '{tool_name}' completed in {tool_duration:.2f} seconds")
-            
-    current_state_updates["messages"] = tool_outputs
-    return current_state_updates
+    # Les outils indépendants partent tout de suite, en parallèle, sur l'état initial
+    independent_indexes = [i for i, tool_call in enumerate(tool_calls) if tool_call['name'] in INDEPENDENT_TOOLS]
+    independent_set = set(independent_indexes)
+    independent_batch = asyncio.gather(*(
+        _run_tool_call(tool_calls[i], ChainMap(state)) for i in independent_indexes
+    ))
+
+    # La chaîne dépendante s'exécute dans l'ordre : via le ChainMap, chaque outil voit
+    # les mises à jour des outils précédents avant l'état initial
+    view = ChainMap(current_state_updates, state)
+    for i, tool_call in enumerate(tool_calls):
+        if i in independent_set:
+            continue
+        results[i] = await _run_tool_call(tool_call, view)
+        current_state_updates.update(results[i][1])
+
+    for i, result in zip(independent_indexes, await independent_batch):
+        results[i] = result
+
+    # On réapplique les mises à jour dans l'ordre des appels pour un résultat identique à une exécution séquentielle
+    node_updates = {}
+    for _, updates in results:
+        node_updates.update(updates)
+    node_updates["messages"] = [tool_message for tool_message, _ in results]
+    node_updates["last_tool_msg_idx"] = len(state['messages']) + len(results) - 1
+    node_updates["current_chain_executed"] = state.get("current_chain_executed", 0) + len(results)
+    return node_updates
 
 # Noeud 3 : generate_final_response_node, synthétise la réponse finale à partir de l'état.
 def generate_final_response_node(state: AgentState):
@@ -634,26 +1085,33 @@ def generate_final_response_node(state: AgentState):
     Génère la réponse textuelle finale ET le graphique Plotly par défaut après une analyse complète.
     Ce noeud est le point de sortie pour une analyse de prédiction.
     """
-    print("\n--- AGENT: Génération de la réponse finale et du graphique ---")
+    logger.info("AGENT: Génération de la réponse finale et du graphique")
     
     # --- 1. Récupération des informations de l'état ---
     ticker = state.get("ticker", "l'action")
     analysis_result = state.get("analysis", "inconnu")
-    processed_df_json = state.get("processed_df_json")
+    processed_df_arrow = state.get("processed_df_arrow")
 
     # --- 2. Construction de la réponse textuelle ---
     response_content = ""
     latest_year_str = "récentes"
     next_year_str = "prochaine"
     
-    if processed_df_json:
+    # Le DataFrame est reconstruit une seule fois, puis réutilisé pour le texte et le graphique
+    df = None
+    if processed_df_arrow:
+        try:
+            df = state_to_df(processed_df_arrow)
+        except Exception as e:
+            logger.warning("Impossible de lire les données pré-traitées : %s", e)
+
+    if df is not None:
         try:
-            df = pd.read_json(StringIO(processed_df_json), orient='split')
             if not df.empty and 'calendarYear' in df.columns:
                 latest_year_str = df['calendarYear'].iloc[-1]
                 next_year_str = str(int(latest_year_str) + 1)
         except Exception as e:
-            print(f"Avertissement : Impossible d'extraire l'année des données : {e}")
+            logger.warning("Impossible d'extraire l'année des données : %s", e)
 
     # Logique de la réponse textuelle basée sur la prédiction
     if analysis_result == "Risque Élevé Détecté":
@@ -672,9 +1130,8 @@ def generate_final_response_node(state: AgentState):
     # --- 3. Création du graphique de synthèse ---
     chart_json = None
     explanation_text = None 
-    if processed_df_json:
+    if df is not None:
         try:
-            df = pd.read_json(StringIO(processed_df_json), orient='split')
             # Les colonnes dont nous avons besoin pour ce nouveau graphique
             metrics_to_plot = ['calendarYear', 'revenuePerShare_YoY_Growth', 'earningsYield']
             
@@ -684,84 +1141,44 @@ def generate_final_response_node(state: AgentState):
             if not df.empty and all(col in plot_cols for col in metrics_to_plot):
                 chart_title = f"Analyse Croissance vs. Valorisation pour {ticker.upper()}"
                 
-                # Créer la figure de base
-                fig = go.Figure()
-
-                # 1. Ajouter les barres de Croissance du CA (% YoY) sur l'axe Y1
-                fig.add_trace(go.Scatter(
-                    x=df['calendarYear'],
-                    y=df['revenuePerShare_YoY_Growth'],
-                    name='Croissance (%)',
-                    mode='lines+markers', # On spécifie le mode ligne avec marqueurs
-                    line=dict(color=stella_theme['colors'][1]), # On utilise 'line' pour la couleur
-                    yaxis='y1'
-                ))
-
-                # 2. Ajouter la ligne de Valorisation (Earnings Yield) sur l'axe Y2
-                fig.add_trace(go.Scatter(
-                    x=df['calendarYear'],
-                    y=df['earningsYield'],
-                    name='Valorisation',
-                    mode='lines+markers',
-                    line=dict(color=stella_theme['colors'][0]), # Bleu Stella
-                    yaxis='y2'
-                ))
-                
-                # Ajouter une ligne à zéro pour mieux visualiser la croissance positive/négative
-                fig.add_hline(y=0, line_width=1, line_dash="dash", line_color="black", yref="y1")
-
-                # 3. Configurer les axes et le layout
-                fig.update_layout(
-                    title_text=chart_title,
-                    template=stella_theme['template'],
-                    font=stella_theme['font'],
-                    **stella_theme['layout_defaults'],  # Applique les paramètres glassmorphism
-                    margin=dict(r=320),
-                    xaxis=dict(
-                        title='Année',
-                        type='category', # Force l'axe à traiter les années comme des étiquettes uniques
-                        **stella_theme['axis_config']  # Applique la configuration d'axes noirs
-                    ),
-                    yaxis=dict(
-                        title=dict(
-                            text='Croissance Annuelle du CA',
-                            font=dict(color=stella_theme['colors'][1])
-                        ),
-                        tickfont=dict(color=stella_theme['colors'][1]),
-                        ticksuffix=' %',
-                        **stella_theme['axis_config']  # Applique la configuration d'axes noirs
-                    ),
-                    yaxis2=dict(
-                        title=dict(
-                            text='Rendement bénéficiaire',
-                            font=dict(color=stella_theme['colors'][0]) 
-                        ),
-                        tickfont=dict(color=stella_theme['colors'][0]),
-                        anchor='x',
-                        overlaying='y',
-                        side='right',
-                        tickformat='.2%',
-                        **stella_theme['axis_config']  # Applique la configuration d'axes noirs
-                    ),
-                    legend=dict(
-                        orientation="v",
-                        yanchor="top",
-                        y=1, # On aligne le haut de la légende avec le haut du graphique
-                        xanchor="left",
-                        x=1.40, # On pousse la légende un peu plus à droite
-                        bordercolor="rgba(0, 0, 0, 0)", # Pas de bordure
-                        borderwidth=0,
-                        title_text="Légende"
-                    )
-                )
+                # La figure est construite directement en dictionnaires : aucun objet go ni validation par trace.
+                # Seul le titre s'ajoute au layout statique, partagé entre les appels (orjson ne fait que le lire).
+                layout = {**synthesis_layout(), 'title': {'text': chart_title}}
+                years = df['calendarYear'].to_numpy()
+
+                fig = {
+                    'data': [
+                        # 1. Croissance du CA (% YoY) sur l'axe Y1
+                        {
+                            'type': 'scatter',
+                            'x': years,
+                            'y': df['revenuePerShare_YoY_Growth'].to_numpy(dtype=np.float64),
+                            'name': 'Croissance (%)',
+                            'mode': 'lines+markers',
+                            'line': {'color': stella_theme['colors'][1]},
+                            'yaxis': 'y',
+                        },
+                        # 2. Valorisation (Earnings Yield) sur l'axe Y2
+                        {
+                            'type': 'scatter',
+                            'x': years,
+                            'y': df['earningsYield'].to_numpy(dtype=np.float64),
+                            'name': 'Valorisation',
+                            'mode': 'lines+markers',
+                            'line': {'color': stella_theme['colors'][0]},
+                            'yaxis': 'y2',
+                        },
+                    ],
+                    'layout': layout,
+                }
                 
-                chart_json = pio.to_json(fig)
+                chart_json = _fig_to_json(fig)
                 response_content += f"\n\n**Voici une visualisation de sa croissance par rapport à sa valorisation :**"
             else:
                 response_content += "\n\n(Impossible de générer le graphique de synthèse Croissance/Valorisation : données ou colonnes manquantes)."
 
         except Exception as e:
-            print(f"Erreur lors de la création du graphique par défaut : {e}")
+            logger.error("Erreur lors de la création du graphique par défaut : %s", e)
             response_content += "\n\n(Je n'ai pas pu générer le graphique associé en raison d'une erreur.)"
     
     # --- 4. Création du message final ---
@@ -780,43 +1197,43 @@ def cleanup_state_node(state: AgentState):
     mais GARDE le contexte principal (données brutes et traitées, ticker)
     pour permettre des questions de suivi.
     """
-    print("\n--- SYSTEM: Nettoyage partiel de l'état avant la sauvegarde ---")
+    logger.info("SYSTEM: Nettoyage partiel de l'état avant la sauvegarde")
     
-    # On garde : 'ticker', 'tickers', 'company_name', 'fetched_df_json', 'processed_df_json'
+    # On garde : 'ticker', 'tickers', 'company_name', 'fetched_df_arrow', 'processed_df_arrow' et leurs colonnes
     # On supprime (réinitialise) :
     return {
         "analysis": "",   # Efface la prédiction précédente
         "plotly_json": "",  # Efface le graphique précédent
+        "chart_warning": "",  # Efface l'avertissement associé
         "error": ""         # Efface toute erreur précédente
     }
 
 # Noeuds supplémentaires de préparation pour l'affichage des données, graphiques, actualités et profil d'entreprise.
 def prepare_data_display_node(state: AgentState):
     """Prépare un AIMessage avec un DataFrame spécifique attaché."""
-    print("\n--- AGENT: Préparation du DataFrame pour l'affichage ---")
+    logger.info("AGENT: Préparation du DataFrame pour l'affichage")
     
-    tool_name_called = next(msg for msg in reversed(state['messages']) if isinstance(msg, AIMessage) and msg.tool_calls).tool_calls[-1]['name']
-
-    if tool_name_called == "display_processed_data" and state.get("processed_df_json"):
-        df_json = state["processed_df_json"]
-        message_content = "Voici les données **pré-traitées** que tu as demandées :"
-    elif tool_name_called == "display_raw_data" and state.get("fetched_df_json"):
-        df_json = state["fetched_df_json"]
-        message_content = "Voici les données **brutes** que tu as demandées :"
-    else:
+    tool_name_called = last_tool_call_message(state).tool_calls[-1]['name']
+
+    state_key = DISPLAY_KEYS.get(tool_name_called)
+    df_arrow = state.get(state_key) if state_key else None
+    if not state_has_df(df_arrow):
         final_message = AIMessage(content="Désolé, les données demandées ne sont pas disponibles.")
         return {"messages": [final_message]}
 
-    final_message = AIMessage(content=message_content)
-    setattr(final_message, 'dataframe_json', df_json)
+    final_message = AIMessage(content=DISPLAY_MESSAGES[tool_name_called])
+    # Le front-end attend du JSON 'split' : la conversion n'a lieu qu'ici, à la sortie du graphe
+    setattr(final_message, 'dataframe_json', df_to_split_json(state_to_df(df_arrow)))
     return {"messages": [final_message]}
 
 def prepare_chart_display_node(state: AgentState):
     """Prépare un AIMessage avec le graphique Plotly demandé par l'utilisateur."""
-    print("\n--- AGENT: Préparation du graphique pour l'affichage ---")
+    logger.info("AGENT: Préparation du graphique pour l'affichage")
     
     # Laisse le LLM générer une courte phrase d'introduction
     response = ("**Voici le graphique demandé :** ")
+    if state.get("chart_warning"):
+        response += f"\n\n⚠️ {state['chart_warning']}"
     
     final_message = AIMessage(content=response)
     setattr(final_message, 'plotly_json', state["plotly_json"])
@@ -825,11 +1242,11 @@ def prepare_chart_display_node(state: AgentState):
 
 def prepare_news_display_node(state: AgentState):
     """Prépare un AIMessage avec les actualités formatées pour l'affichage."""
-    print("\n--- AGENT: Préparation de l'affichage des actualités ---")
+    logger.info("AGENT: Préparation de l'affichage des actualités")
     
     # 1. Retrouver le ToolMessage qui contient le résultat des actualités
     # On cherche le dernier message de type ToolMessage dans l'historique
-    tool_message = next((msg for msg in reversed(state['messages']) if isinstance(msg, ToolMessage)), None)
+    tool_message = last_tool_message(state)
     
     if not tool_message or not tool_message.content:
         final_message = AIMessage(content="Désolé, je n'ai pas pu récupérer les actualités.")
@@ -848,72 +1265,73 @@ def prepare_news_display_node(state: AgentState):
     final_message = AIMessage(content=response_content)
     
     # 3. Attacher le JSON des actualités au message final
-    # Le front-end (Streamlit) utilisera cet attribut pour afficher les articles
-    setattr(final_message, 'news_json', tool_message.content)
+    # Le front-end utilisera cet attribut pour afficher les articles.
+    # L'outil renvoie déjà une chaîne JSON, transmise telle quelle ; un contenu structuré
+    # (liste ou dict) est encodé une seule fois avec orjson, sans aller-retour json.loads / json.dumps.
+    content = tool_message.content
+    news_json = content if isinstance(content, str) else orjson.dumps(content, default=_json_default).decode()
+    setattr(final_message, 'news_json', news_json)
     
     return {"messages": [final_message]}
 
-def prepare_profile_display_node(state: AgentState):
+async def prepare_profile_display_node(state: AgentState, config: RunnableConfig):
     """Prépare un AIMessage avec le profil de l'entreprise pour l'affichage."""
-    print("\n--- AGENT: Préparation de l'affichage du profil d'entreprise ---")
+    logger.info("AGENT: Préparation de l'affichage du profil d'entreprise")
     
-    tool_message = next((msg for msg in reversed(state['messages']) if isinstance(msg, ToolMessage)), None)
+    tool_message = last_tool_message(state)
     
     if not tool_message or not tool_message.content:
         final_message = AIMessage(content="Désolé, je n'ai pas pu récupérer le profil de l'entreprise.")
         return {"messages": [final_message]}
 
     # Debug: afficher le contenu du profil reçu
-    print(f"[DEBUG] Profile content received in prepare_profile_display_node:")
-    print(f"  Content: {tool_message.content[:200]}...")
+    logger.debug("Profil reçu dans prepare_profile_display_node : %.200s...", tool_message.content)
     
-    prompt = f"""
-    Voici les informations de profil pour une entreprise au format JSON :
-    {tool_message.content}
-    **INFORMATION CRUCIALE :**
-    TU DOIS rédiger une réponse formatée en markdown pour présenter ces informations à l'utilisateur EN FRANÇAIS.
-    Rédige une réponse la plus exhaustive et agréable possible pour présenter ces informations à l'utilisateur.
-    Mets en avant le nom de l'entreprise, son secteur et son CEO, mais n'omet aucune information qui n'est pas null dans le JSON.
-    Tu n'afficheras pas l'image du logo, l'UI s'en chargera, et tu n'as pas besoin de la mentionner.
-    Présente les informations de manière sobre en listant les points du JSON.
-    IMPORTANT: Si la description est déjà en français dans le JSON, utilise-la EXACTEMENT comme elle est écrite.
-    Si il y a un champ null, TU DOIS TOUJOURS le compléter via tes connaissances, sans inventer de données.
-    Si tu ne trouves pas d'informations, indique simplement "Inconnu" ou "Non disponible".
-    Termine en donnant le lien vers leur site web.
-    """
-    response = llm.invoke(prompt)
-    print(f"response.content: {response.content}")
+    # Même profil JSON = même prompt : la présentation déjà rédigée est réutilisée via le cache des réponses du LLM
+    prompt_input = {"profile_json": tool_message.content}
+    cache_key = llm_cache_key(PROFILE_PROMPT.format_messages(**prompt_input)) if LLM_CACHE_ENABLED else None
+    response = llm_cache_get(cache_key) if cache_key else None
+    if response is None:
+        # Config du nœud transmise explicitement pour le streaming et le tracing (voir agent_node)
+        response = await get_profile_chain().ainvoke(prompt_input, config=config)
+        if cache_key and response.content:
+            llm_cache_put(cache_key, response)
+    else:
+        logger.info("Présentation du profil reprise du cache", extra={"event": "llm_cache_hit", "node": "prepare_profile_display"})
+    logger.debug("response.content: %s", response.content)
     final_message = AIMessage(content=response.content)
     
     # On attache le JSON pour que le front-end puisse afficher l'image du logo !
     setattr(final_message, 'profile_json', tool_message.content)
     
     # Debug: afficher le JSON qui sera envoyé au frontend
-    print(f"[DEBUG] Profile JSON attached to message:")
-    print(f"  JSON: {tool_message.content[:300]}...")
+    logger.debug("Profil JSON attaché au message : %.300s...", tool_message.content)
     
     return {"messages": [final_message]}
 
 # Noeud de gestion des erreurs
+# Réponse affichée à l'utilisateur en cas d'erreur, mise en forme une seule fois
+ERROR_TEMPLATE = textwrap.dedent("""
+    Désolé, une erreur est survenue et je n'ai pas pu terminer ta demande.
+    
+    **Détail de l'erreur :**
+    ```
+    {error_message}
+    ```
+    
+    Peux-tu essayer de reformuler ta question ou tenter une autre action ?
+""")
+
 def handle_error_node(state: AgentState):
     """
     Génère un message d'erreur clair pour l'utilisateur, puis prépare le nettoyage de l'état.
     Ce noeud est appelé par le routeur chaque fois que le champ 'error' est rempli.
     """
-    print("\n--- AGENT: Gestion de l'erreur... ---")
+    logger.info("AGENT: Gestion de l'erreur...")
     error_message = state.get("error", "Une erreur inconnue est survenue.")
     
     # On crée une réponse claire et formatée pour l'utilisateur.
-    user_facing_error = textwrap.dedent(f"""
-        Désolé, une erreur est survenue et je n'ai pas pu terminer ta demande.
-        
-        **Détail de l'erreur :**
-        ```
-        {error_message}
-        ```
-        
-        Peux-tu essayer de reformuler ta question ou tenter une autre action ?
-    """)
+    user_facing_error = ERROR_TEMPLATE.format(error_message=error_message)
     
     # On met cette réponse dans un AIMessage qui sera affiché dans le chat.
     # L'étape suivante sera le nettoyage de l'état.
@@ -922,77 +1340,94 @@ def handle_error_node(state: AgentState):
 # --- Router pour diriger le flux du graph ---
 def router(state: AgentState) -> str:
     """Le routeur principal du graphe, version finale robuste avec support du tool chaining."""
-    print("\n--- ROUTEUR: Évaluation de l'état pour choisir la prochaine étape ---")
+    logger.debug("ROUTEUR: Évaluation de l'état pour choisir la prochaine étape")
 
     # On récupère les messages de l'état
     messages = state['messages']
     
     # Y a-t-il une erreur ? C'est la priorité absolue.
     if state.get("error"):
-        print("Routeur -> Décision: Erreur détectée, passage au gestionnaire d'erreurs.")
+        logger.info("Routeur -> Décision: Erreur détectée, passage au gestionnaire d'erreurs.")
         return "handle_error"
 
     # Le dernier message est-il une décision de l'IA d'appeler un outil ?
     last_message = messages[-1]
 
     if isinstance(last_message, AIMessage) and not last_message.tool_calls:
-        print("Routeur -> Décision: L'IA a fourni une réponse textuelle. Fin du cycle.")
+        logger.info("Routeur -> Décision: L'IA a fourni une réponse textuelle. Fin du cycle.")
         return END
     if isinstance(last_message, AIMessage) and last_message.tool_calls:
         # C'est la première fois qu'on voit cette décision, on doit exécuter l'outil.
-        print("Routeur -> Décision: Appel d'outil demandé, passage à execute_tool.")
+        logger.info("Routeur -> Décision: Appel d'outil demandé, passage à execute_tool.")
         return "execute_tool"
 
     # Si le dernier message n'est PAS un appel à un outil, cela signifie probablement
     # qu'un outil vient de s'exécuter. Nous devons décider où aller ensuite.
     
     # On retrouve le dernier appel à un outil fait par l'IA
-    ai_message_with_tool_call = next(
-        (msg for msg in reversed(messages) if isinstance(msg, AIMessage) and msg.tool_calls),
-        None
-    )
+    ai_message_with_tool_call = last_tool_call_message(state)
     # S'il n'y en a pas, on ne peut rien faire de plus.
     if not ai_message_with_tool_call:
-        print("Routeur -> Décision: Aucune action claire à prendre (pas d'appel d'outil trouvé), fin du processus.")
+        logger.info("Routeur -> Décision: Aucune action claire à prendre (pas d'appel d'outil trouvé), fin du processus.")
         return END
     
     # Check if there are multiple tool calls to execute in sequence
+    # Compteurs tenus par agent_node et execute_tool_node pour la chaîne en cours.
+    # Sans compteur (état sauvegardé avant leur ajout), la chaîne est considérée comme terminée.
     remaining_tool_calls = ai_message_with_tool_call.tool_calls
-    executed_tool_calls = [msg for msg in reversed(messages) if isinstance(msg, ToolMessage)]
+    total_tool_calls = state.get("current_chain_total", len(remaining_tool_calls))
+    executed_tool_calls = state.get("current_chain_executed", total_tool_calls)
     
-    print(f"--- ROUTEUR: Nombre total d'outils à exécuter: {len(remaining_tool_calls)}, déjà exécutés: {len(executed_tool_calls)}")
+    logger.debug("ROUTEUR: Nombre total d'outils à exécuter: %d, déjà exécutés: %d", total_tool_calls, executed_tool_calls)
     
     # If we still have tools to execute from the same AI message, continue executing them
-    if len(executed_tool_calls) < len(remaining_tool_calls):
-        next_tool_name = remaining_tool_calls[len(executed_tool_calls)]['name']
-        print(f"Routeur -> Décision: Outil suivant dans la chaîne: '{next_tool_name}', continuer l'exécution.")
+    if executed_tool_calls < total_tool_calls:
+        next_tool_name = remaining_tool_calls[executed_tool_calls]['name']
+        logger.info("Routeur -> Décision: Outil suivant dans la chaîne: '%s', continuer l'exécution.", next_tool_name)
         return "execute_tool"
         
     # All tools from the current AI message have been executed, check the last executed tool
     tool_name = ai_message_with_tool_call.tool_calls[-1]['name']
-    print(f"--- ROUTEUR: Tous les outils de la chaîne ont été exécutés, le dernier était '{tool_name}'. ---")
+    logger.debug("ROUTEUR: Tous les outils de la chaîne ont été exécutés, le dernier était '%s'.", tool_name)
 
     # Maintenant, on décide de la suite en fonction du dernier outil de la chaîne.
-    if tool_name == 'analyze_risks':
-        return "generate_final_response"
-    elif tool_name == 'compare_stocks': 
-        return "prepare_chart_display"
-    elif tool_name == 'display_price_chart':
-        return "prepare_chart_display"
-    elif tool_name in ['display_raw_data', 'display_processed_data']:
-        return "prepare_data_display"
-    elif tool_name == 'create_dynamic_chart':
-        return "prepare_chart_display"
-    elif tool_name == 'get_stock_news':
-        return "prepare_news_display"
-    elif tool_name == 'get_company_profile': 
-        return "prepare_profile_display"
-    else: # Pour search_ticker, fetch_data, preprocess_data, etc
-        return "agent"
+    # Pour search_ticker, fetch_data, preprocess_data, etc : retour à l'agent
+    return TOOL_TO_NODE.get(tool_name, "agent")
     
 # --- CONSTRUCTION DU GRAPH ---
+def render_graph_png(app, path: str = "agent_workflow.png"):
+    """
+    Enregistre la visualisation du graphe en PNG.
+    Le rendu est mis en cache par empreinte de la définition Mermaid : tant que le graphe ne change pas,
+    agent_workflow.<empreinte>.png existe déjà et rien n'est redessiné.
+    """
+    try:
+        graph = app.get_graph()
+        digest = hashlib.blake2b(graph.draw_mermaid().encode(), digest_size=8).hexdigest()
+        base, extension = os.path.splitext(path)
+        versioned_path = f"{base}.{digest}{extension}"
+        if os.path.exists(versioned_path):
+            logger.debug("Visualisation du graph déjà à jour (%s)", versioned_path)
+            return
+
+        image_bytes = graph.draw_mermaid_png()
+        for output_path in (versioned_path, path):
+            with open(output_path, "wb") as f:
+                f.write(image_bytes)
+        
+        logger.info("Visualisation du graph sauvegardée dans le répertoire en tant que %s", path)
+
+    except Exception as e:
+        logger.warning("Je n'ai pas pu générer la visualisation. Lancez 'pip install playwright' et 'playwright install'. Erreur: %s", e)
+
+# Les checkpoints restent en mémoire : les DataFrames qu'ils référencent vivent dans BLOB_CACHE,
+# propre au processus. Les conversations inactives depuis un jour sont effacées.
+CHECKPOINT_THREAD_TTL = 24 * 3600
+CHECKPOINT_MAX_THREADS = 1000
+
 def get_agent_app():
-    memory = MemorySaver()
+    start_log_listener()
+    memory = ExpiringMemorySaver(ttl=CHECKPOINT_THREAD_TTL, max_threads=CHECKPOINT_MAX_THREADS)
     workflow = StateGraph(AgentState)
 
     workflow.add_node("agent", agent_node)
@@ -1033,42 +1468,48 @@ def get_agent_app():
 
     app = workflow.compile(checkpointer=memory)
 
-    try:
-        graph = app.get_graph()
-        image_bytes = graph.draw_mermaid_png()
-        with open("agent_workflow.png", "wb") as f:
-            f.write(image_bytes)
-        
-        print("\nVisualisation du graph sauvegardée dans le répertoire en tant que agent_workflow.png \n")
+    # Un seul tracer LangSmith, attaché une fois à la config du graphe : LangChain n'en recrée
+    # plus un à chaque appel à partir des variables d'environnement (il détecte celui-ci et s'abstient)
+    if os.environ.get("LANGCHAIN_TRACING_V2") == "true":
+        tracer = LangChainTracer(project_name=LANGSMITH_PROJECT, client=get_langsmith_client(), tags=["stella-agent"])
+        app = app.with_config({"callbacks": [tracer]})
 
-    except Exception as e:
-        print(f"\nJe n'ai pas pu générer la visualisation. Lancez 'pip install playwright' et 'playwright install'. Erreur: {e}\n")
+    # Le rendu Mermaid (appel réseau ou navigateur headless) est un artefact de développement :
+    # il n'est fait que sur demande, avec STELLA_RENDER_GRAPH=1
+    if os.environ.get("STELLA_RENDER_GRAPH") == "1":
+        render_graph_png(app)
     
     return app
 
 app = get_agent_app()
 
+@functools.lru_cache(maxsize=1)
+def get_graph_structure() -> dict:
+    """Nœuds et arêtes du graphe compilé, pour le frontend : le graphe ne change pas pendant la vie du processus."""
+    graph_json = app.get_graph().to_json()
+    return {'nodes': graph_json.get('nodes', []), 'edges': graph_json.get('edges', [])}
+
 # --- Session mapping functions for dual session system ---
 def register_message_session_mapping(message_session_id: str, conversation_session_id: str):
     """Register mapping between message session ID and conversation session ID"""
     MESSAGE_TO_CONVERSATION_MAPPING[message_session_id] = conversation_session_id
-    print(f"📝 Registered session mapping: {message_session_id} -> {conversation_session_id}")
+    logger.debug("Session mapping enregistré : %s -> %s", message_session_id, conversation_session_id)
 
 def get_conversation_session_id(session_id: str) -> str:
     """Get conversation session ID from either message or conversation session ID"""
     # If it's already a conversation session ID, return as is
     if session_id.startswith('conversation_'):
-        print(f"🔍 Session mapping: {session_id} is already a conversation ID")
+        logger.debug("Session mapping : %s est déjà un ID de conversation", session_id)
         return session_id
     
     # If it's a message session ID, return the mapped conversation session ID
     if session_id in MESSAGE_TO_CONVERSATION_MAPPING:
         conversation_id = MESSAGE_TO_CONVERSATION_MAPPING[session_id]
-        print(f"🔍 Session mapping lookup: {session_id} -> {conversation_id}")
+        logger.debug("Session mapping : %s -> %s", session_id, conversation_id)
         return conversation_id
     
     # If no mapping found, return as is (fallback)
-    print(f"🔍 Session mapping: No mapping found for {session_id}, using as-is")
+    logger.debug("Session mapping : aucune correspondance pour %s, utilisé tel quel", session_id)
     return session_id
 
 def get_langsmith_trace_data_for_message(conversation_session_id: str, message_session_id: str, run_id: str = None):
@@ -1077,43 +1518,54 @@ def get_langsmith_trace_data_for_message(conversation_session_id: str, message_s
     This function looks for LangGraph runs that have the specific message session ID
     in their metadata.
     """
-    print(f"🔍 Getting trace data for message {message_session_id} in conversation {conversation_session_id}")
+    logger.debug("Getting trace data for message %s in conversation %s", message_session_id, conversation_session_id)
+    if not langsmith_tracing_enabled():
+        logger.debug("LangSmith tracing disabled or API key missing, no trace to fetch")
+        return None
     
     try:
-        from langsmith import Client
-        client = Client()
-        project_name = os.environ.get("LANGCHAIN_PROJECT", "stella")
+        client = get_langsmith_client()
+        project_name = LANGSMITH_PROJECT
         
         # Get recent runs and look for ones with our message session ID in metadata
-        # Limit to 50 most recent runs for faster processing
-        recent_runs = list(client.list_runs(
+        # Le filtre sur la métadonnée est appliqué côté LangSmith plutôt que sur les 50 derniers runs du projet
+        message_filter = (
+            f'and(eq(name, "LangGraph"), eq(metadata_key, "message_session_id"), '
+            f'eq(metadata_value, "{message_session_id}"))'
+        )
+        # Les runs sont parcourus à la volée : on s'arrête au premier qui correspond
+        runs_iter = client.list_runs(
             project_name=project_name,
-            limit=50  # Reduced limit for faster processing
-        ))
+            filter=message_filter,
+            select=LANGSMITH_SUMMARY_FIELDS + ['session_id', 'extra'],
+            limit=5
+        )
         
-        print(f"🔍 Searching through {len(recent_runs)} runs for message session ID: {message_session_id}")
+        logger.debug("Searching runs for message session ID: %s", message_session_id)
         
         # Look for LangGraph runs that have our message session ID in metadata
-        target_run = None
-        for run in recent_runs:
-            if run.name == "LangGraph":
-                # Check if this run has our message session ID in metadata
-                if hasattr(run, 'extra') and run.extra:
-                    metadata = run.extra.get('metadata', {})
-                    if metadata.get('message_session_id') == message_session_id:
-                        target_run = run
-                        print(f"✅ Found LangGraph run with message session ID: {str(run.id)[:8]}...")
-                        break
+        target_run = next(
+            (
+                run for run in runs_iter
+                if run.name == "LangGraph"
+                and run.extra
+                and run.extra.get('metadata', {}).get('message_session_id') == message_session_id
+            ),
+            None,
+        )
+        if target_run:
+            logger.debug("Found LangGraph run with message session ID: %s...", str(target_run.id)[:8])
         
         if not target_run:
-            print(f"⚠️  No LangGraph run found with message session ID {message_session_id}")
-            print(f"🔄 Falling back to conversation-level trace data")
+            logger.warning("No LangGraph run found with message session ID %s", message_session_id)
+            logger.debug("Falling back to conversation-level trace data")
             # Fallback to conversation-level data
             return get_langsmith_trace_data(conversation_session_id, run_id)
         
         # Get trace data for the specific run
-        actual_thread_id = target_run.session_id or target_run.thread_id or str(target_run.id)
-        print(f"🎯 Using thread ID: {actual_thread_id}")
+        getters = thread_id_getters(target_run, order=('session_id', 'thread_id', 'extra'))
+        actual_thread_id = run_thread_id(target_run, getters) or str(target_run.id)
+        logger.debug("Using thread ID: %s", actual_thread_id)
         
         # Use the existing function but with the specific run's thread ID
         trace_data = get_langsmith_trace_data(actual_thread_id, str(target_run.id))
@@ -1122,16 +1574,79 @@ def get_langsmith_trace_data_for_message(conversation_session_id: str, message_s
             trace_data['message_session_id'] = message_session_id
             trace_data['conversation_session_id'] = conversation_session_id
             trace_data['specific_run_found'] = True
-            print(f"✅ Returning specific trace data for message {message_session_id}")
+            logger.debug("Returning specific trace data for message %s", message_session_id)
         
         return trace_data
         
     except Exception as e:
-        print(f"❌ Error getting trace data for message {message_session_id}: {e}")
-        print(f"🔄 Falling back to conversation-level trace data")
+        logger.warning("Error getting trace data for message %s: %s", message_session_id, e)
+        logger.debug("Falling back to conversation-level trace data")
         # Fallback to conversation-level data
         return get_langsmith_trace_data(conversation_session_id, run_id)
 
+# Champs demandés à LangSmith (select) : les champs obligatoires du schéma Run, puis ceux
+# lus pour reconstruire une trace. Le reste (coûts, feedback, events...) n'est pas transféré.
+# Les inputs/outputs, volumineux, ne sont chargés que pour les runs qui en ont besoin (fetch_run_details).
+LANGSMITH_SUMMARY_FIELDS = ['id', 'name', 'run_type', 'start_time', 'trace_id']
+LANGSMITH_TRACE_FIELDS = LANGSMITH_SUMMARY_FIELDS + [
+    'parent_run_id', 'session_id', 'end_time', 'error', 'extra',
+]
+LANGSMITH_DETAIL_FIELDS = ['inputs', 'outputs']
+
+def tool_call_run_fields(run) -> dict:
+    """Champs d'un appel d'outil tirés de son run (statut, durée, horodatage) : calculés une fois par run."""
+    start_time, end_time = run.start_time, run.end_time
+    return {
+        'status': 'completed' if end_time else 'executing',
+        'execution_time': (end_time - start_time).total_seconds() * 1000 if end_time and start_time else 0,
+        'timestamp': start_time.isoformat() if start_time else None,
+        'run_id': str(run.id),
+        'error': run.error,
+    }
+
+# start_time est obligatoire dans le schéma Run : pas besoin de repli sur end_time pour trier
+_run_start_key = operator.attrgetter('start_time')
+
+def fetch_run_details(client, runs, fields=LANGSMITH_DETAIL_FIELDS) -> None:
+    """
+    Complète en place des runs chargés sans inputs/outputs, en une seule requête par identifiants.
+    Les runs qui ont déjà leurs inputs (requête sans projection) ne sont pas redemandés.
+    """
+    by_id = {run.id: run for run in runs if not run.inputs}
+    if not by_id:
+        return
+    for detail in client.list_runs(run_ids=list(by_id), select=LANGSMITH_SUMMARY_FIELDS + list(fields)):
+        run = by_id.get(detail.id)
+        if run is not None:
+            for field in fields:
+                setattr(run, field, getattr(detail, field))
+
+# --- Lecture du thread_id d'un run LangSmith ---
+# Selon la version du SDK, le thread_id d'un run est un attribut, une clé de `extra` ou le session_id.
+# Tous les runs d'une même requête ont la même forme : on sonde un run une seule fois pour lier
+# les accesseurs disponibles, au lieu d'enchaîner des hasattr sur chaque run.
+_THREAD_ID_ACCESSORS = {
+    'thread_id': operator.attrgetter('thread_id'),
+    'extra': lambda run: (run.extra or {}).get('thread_id'),
+    'session_id': operator.attrgetter('session_id'),
+}
+
+def thread_id_getters(sample_run, order=('thread_id', 'extra', 'session_id')) -> tuple:
+    """Retourne, dans l'ordre demandé, les accesseurs de thread_id disponibles sur ce type de run."""
+    return tuple(_THREAD_ID_ACCESSORS[name] for name in order if hasattr(sample_run, name))
+
+def run_thread_id(run, getters) -> Optional[str]:
+    """Premier thread_id renseigné sur le run, via les accesseurs liés par thread_id_getters."""
+    for get in getters:
+        value = get(run)
+        if value:
+            return value
+    return None
+
+def run_in_thread(run, getters, thread_id_str: str) -> bool:
+    """Indique si l'un des identifiants du run correspond au thread demandé."""
+    return any(str(get(run)) == thread_id_str for get in getters)
+
 # --- Crée une animation du workflow ---
 def find_actual_thread_id(requested_thread_id: str, client) -> Optional[str]:
     """
@@ -1141,36 +1656,34 @@ def find_actual_thread_id(requested_thread_id: str, client) -> Optional[str]:
     Strategy: Find the most recent LangGraph run (main workflow) and use its session_id
     """
     try:
-        project_name = os.environ.get("LANGCHAIN_PROJECT", "stella")
+        project_name = LANGSMITH_PROJECT
         
         # Get recent runs to find the mapping
+        # Seuls les runs racines "LangGraph" nous intéressent : le filtre est appliqué côté LangSmith
         recent_runs = list(client.list_runs(
             project_name=project_name,
-            limit=100  # Get more recent runs to find the latest
+            filter='eq(name, "LangGraph")',
+            is_root=True,
+            select=LANGSMITH_SUMMARY_FIELDS + ['end_time', 'session_id', 'extra'],
+            limit=50  # Les 50 workflows les plus récents suffisent pour retrouver la session
         ))
         
-        print(f"🔍 Searching for thread_id mapping for '{requested_thread_id}' in {len(recent_runs)} recent runs")
+        logger.debug("Searching for thread_id mapping for '%s' in %s recent runs", requested_thread_id, len(recent_runs))
         
         # Look for LangGraph runs and create a proper mapping
         if recent_runs:
             # Sort by start time to get chronological order
-            recent_runs.sort(key=lambda r: r.start_time or r.end_time or 0, reverse=True)
+            recent_runs.sort(key=_run_start_key, reverse=True)
             
-            print(f"   📋 Checking recent runs for LangGraph entries:")
+            logger.debug("Checking recent runs for LangGraph entries:")
             langraph_runs = []
+            getters = thread_id_getters(recent_runs[0], order=('session_id', 'thread_id', 'extra'))
             
             # Look specifically for LangGraph runs (main workflow)
             for i, run in enumerate(recent_runs[:50]):  # Check top 50 to find more recent ones
                 if run.name == "LangGraph":
                     # Get the session_id from this run
-                    actual_thread_id = None
-                    
-                    if hasattr(run, 'session_id') and run.session_id:
-                        actual_thread_id = run.session_id
-                    elif hasattr(run, 'thread_id') and run.thread_id:
-                        actual_thread_id = run.thread_id
-                    elif hasattr(run, 'extra') and run.extra and run.extra.get('thread_id'):
-                        actual_thread_id = run.extra['thread_id']
+                    actual_thread_id = run_thread_id(run, getters)
                     
                     if actual_thread_id:
                         langraph_runs.append({
@@ -1179,14 +1692,14 @@ def find_actual_thread_id(requested_thread_id: str, client) -> Optional[str]:
                             'start_time': run.start_time,
                             'rank': i + 1
                         })
-                        print(f"      #{i+1}: LangGraph run {str(run.id)[:8]}... with session_id: {actual_thread_id}")
+                        logger.debug("#%s: LangGraph run %s... with session_id: %s", i + 1, str(run.id)[:8], actual_thread_id)
             
             # Create a mapping based on the requested assistant ID
             if langraph_runs and requested_thread_id.startswith('assistant-'):
                 try:
                     # Extract the assistant number (e.g., "assistant-5" -> 5)
                     assistant_number = int(requested_thread_id.split('-')[1])
-                    print(f"   🎯 Looking for assistant session #{assistant_number}")
+                    logger.debug("Looking for assistant session #%s", assistant_number)
                     
                     # Group by unique session_id to get distinct sessions
                     unique_sessions = {}
@@ -1198,25 +1711,25 @@ def find_actual_thread_id(requested_thread_id: str, client) -> Optional[str]:
                     # Sort unique sessions by chronological order (most recent first)
                     sorted_sessions = sorted(unique_sessions.values(), key=lambda x: x['rank'])
                     
-                    print(f"   📊 Found {len(sorted_sessions)} unique sessions:")
+                    logger.debug("Found %s unique sessions:", len(sorted_sessions))
                     for i, session_info in enumerate(sorted_sessions[:10]):
-                        print(f"      Session #{i+1}: {session_info['session_id']} (rank #{session_info['rank']})")
+                        logger.debug("Session #%s: %s (rank #%s)", i + 1, session_info['session_id'], session_info['rank'])
                     
                     # Map assistant numbers to sessions in reverse chronological order
                     # assistant-1 = most recent, assistant-2 = second most recent, etc.
                     if assistant_number <= len(sorted_sessions):
                         target_session = sorted_sessions[assistant_number - 1]
-                        print(f"   ✅ Mapping {requested_thread_id} to session: {target_session['session_id']}")
-                        print(f"   Run ID: {target_session['run_id'][:8]}... (rank #{target_session['rank']})")
+                        logger.debug("Mapping %s to session: %s", requested_thread_id, target_session['session_id'])
+                        logger.debug("Run ID: %s... (rank #%s)", target_session['run_id'][:8], target_session['rank'])
                         return str(target_session['session_id'])
                     else:
-                        print(f"   ⚠️  Assistant number {assistant_number} exceeds available sessions ({len(sorted_sessions)})")
-                        print(f"   🔄 Falling back to most recent session")
+                        logger.warning("Assistant number %s exceeds available sessions (%s)", assistant_number, len(sorted_sessions))
+                        logger.debug("Falling back to most recent session")
                         most_recent = sorted_sessions[0]
                         return str(most_recent['session_id'])
                         
                 except (ValueError, IndexError) as e:
-                    print(f"   ❌ Error parsing assistant number from '{requested_thread_id}': {e}")
+                    logger.warning("Error parsing assistant number from '%s': %s", requested_thread_id, e)
                     # Fall back to most recent
                     if langraph_runs:
                         unique_sessions = {}
@@ -1227,7 +1740,7 @@ def find_actual_thread_id(requested_thread_id: str, client) -> Optional[str]:
                         
                         sorted_sessions = sorted(unique_sessions.values(), key=lambda x: x['rank'])
                         most_recent = sorted_sessions[0]
-                        print(f"   🔄 Using most recent session as fallback: {most_recent['session_id']}")
+                        logger.debug("Using most recent session as fallback: %s", most_recent['session_id'])
                         return str(most_recent['session_id'])
             
             # For non-assistant IDs, use the most recent session (original behavior)
@@ -1240,47 +1753,33 @@ def find_actual_thread_id(requested_thread_id: str, client) -> Optional[str]:
                 
                 sorted_sessions = sorted(unique_sessions.values(), key=lambda x: x['rank'])
                 most_recent = sorted_sessions[0]
-                print(f"   ✅ Using most recent session for non-assistant ID: {most_recent['session_id']}")
+                logger.debug("Using most recent session for non-assistant ID: %s", most_recent['session_id'])
                 return str(most_recent['session_id'])
             
             # Fallback: Look for any recent runs with session_ format (backend-generated sessions)
-            print(f"   ⚠️  No LangGraph runs found, checking for backend-generated sessions...")
+            logger.warning("No LangGraph runs found, checking for backend-generated sessions...")
             for i, run in enumerate(recent_runs[:20]):  # Check top 20 most recent
-                actual_thread_id = None
-                
-                if hasattr(run, 'session_id') and run.session_id:
-                    actual_thread_id = run.session_id
-                elif hasattr(run, 'thread_id') and run.thread_id:
-                    actual_thread_id = run.thread_id
-                elif hasattr(run, 'extra') and run.extra and run.extra.get('thread_id'):
-                    actual_thread_id = run.extra['thread_id']
+                actual_thread_id = run_thread_id(run, getters)
                 
                 # Prefer sessions that start with 'session_' (backend-generated)
                 if actual_thread_id and str(actual_thread_id).startswith('session_'):
-                    print(f"   ✅ Found backend-generated session: {actual_thread_id} from run {run.name} (rank #{i+1})")
+                    logger.debug("Found backend-generated session: %s from run %s (rank #%s)", actual_thread_id, run.name, i + 1)
                     return str(actual_thread_id)
             
             # Final fallback: any session_id
-            print(f"   ⚠️  No backend sessions found, using any recent session...")
+            logger.warning("No backend sessions found, using any recent session...")
             for i, run in enumerate(recent_runs[:10]):  # Check top 10 most recent
-                actual_thread_id = None
-                
-                if hasattr(run, 'session_id') and run.session_id:
-                    actual_thread_id = run.session_id
-                elif hasattr(run, 'thread_id') and run.thread_id:
-                    actual_thread_id = run.thread_id
-                elif hasattr(run, 'extra') and run.extra and run.extra.get('thread_id'):
-                    actual_thread_id = run.extra['thread_id']
+                actual_thread_id = run_thread_id(run, getters)
                 
                 if actual_thread_id:
-                    print(f"   Found fallback session_id: {actual_thread_id} from run {run.name} (rank #{i+1})")
+                    logger.debug("Found fallback session_id: %s from run %s (rank #%s)", actual_thread_id, run.name, i + 1)
                     return str(actual_thread_id)
         
-        print(f"   ❌ Could not find mapping for '{requested_thread_id}'")
+        logger.warning("Could not find mapping for '%s'", requested_thread_id)
         return None
         
     except Exception as e:
-        print(f"   ❌ Error finding thread_id mapping: {e}")
+        logger.warning("Error finding thread_id mapping: %s", e)
         return None
 
 
@@ -1293,383 +1792,367 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
         thread_id: The thread/session ID
         run_id: Optional specific run ID to filter to a single run within the thread
     """
-    import time
-    start_time = time.time()
+    start_time = time.perf_counter()
+    # Les boucles qui ne servent qu'à journaliser ne tournent que si le niveau DEBUG est actif
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     
-    print(f"\n{'='*80}")
-    print(f"🔍 LANGSMITH TRACE DEBUG - Starting trace retrieval for: {thread_id}")
+    logger.debug("LANGSMITH TRACE DEBUG - Starting trace retrieval for: %s", thread_id)
     if run_id:
-        print(f"🎯 SPECIFIC RUN ID REQUESTED: {run_id}")
-    print(f"{'='*80}")
+        logger.debug("SPECIFIC RUN ID REQUESTED: %s", run_id)
     
     # STEP 1: Environment and configuration check
-    print(f"\n📋 STEP 1: Environment Configuration Check")
-    print(f"   LANGCHAIN_PROJECT: {os.environ.get('LANGCHAIN_PROJECT', '❌ NOT_SET')}")
-    print(f"   LANGSMITH_API_KEY: {'✅ SET' if os.environ.get('LANGSMITH_API_KEY') else '❌ NOT_SET'}")
-    print(f"   LANGCHAIN_TRACING_V2: {os.environ.get('LANGCHAIN_TRACING_V2', '❌ NOT_SET')}")
-    print(f"   LANGCHAIN_ENDPOINT: {os.environ.get('LANGCHAIN_ENDPOINT', '❌ NOT_SET')}")
+    logger.debug("STEP 1: Environment Configuration Check")
+    logger.debug("LANGCHAIN_PROJECT: %s", os.environ.get('LANGCHAIN_PROJECT', 'NOT_SET'))
+    logger.debug("LANGSMITH_API_KEY: %s", 'SET' if os.environ.get('LANGSMITH_API_KEY') else 'NOT_SET')
+    logger.debug("LANGCHAIN_TRACING_V2: %s", os.environ.get('LANGCHAIN_TRACING_V2', 'NOT_SET'))
+    logger.debug("LANGCHAIN_ENDPOINT: %s", os.environ.get('LANGCHAIN_ENDPOINT', 'NOT_SET'))
     
-    # Check if tracing is enabled
-    if os.environ.get('LANGCHAIN_TRACING_V2') != 'true':
-        print(f"   ⚠️  WARNING: LANGCHAIN_TRACING_V2 is not set to 'true'")
-        print(f"   This means LangSmith tracing might not be active!")
+    # Check if tracing is enabled : sans tracing ni clé d'API, on s'arrête avant tout appel réseau
+    if not langsmith_tracing_enabled():
+        logger.warning("LangSmith tracing disabled (LANGCHAIN_TRACING_V2 != 'true') or API key missing, no trace to fetch")
+        return None
     
     try:
         # STEP 2: Initialize LangSmith client
-        print(f"\n🔧 STEP 2: Initializing LangSmith Client")
+        logger.debug("STEP 2: Initializing LangSmith Client")
         try:
-            from langsmith import Client
-            client = Client()
-            print(f"   ✅ LangSmith client initialized successfully")
+            client = get_langsmith_client()
+            logger.debug("LangSmith client initialized successfully")
             
             # Test client connection
             try:
                 # Try to get client info to test connection
-                print(f"   🔗 Testing client connection...")
+                logger.debug("Testing client connection...")
                 client_info = client.info
-                print(f"   ✅ Client connection test successful")
+                logger.debug("Client connection test successful")
             except Exception as conn_test_error:
-                print(f"   ⚠️  Client connection test failed: {conn_test_error}")
-                print(f"   This might indicate API key or network issues")
+                logger.warning("Client connection test failed: %s", conn_test_error)
+                logger.debug("This might indicate API key or network issues")
                 
         except ImportError as import_error:
-            print(f"   ❌ Failed to import LangSmith Client: {import_error}")
+            logger.warning("Failed to import LangSmith Client: %s", import_error)
             raise import_error
         except Exception as client_error:
-            print(f"   ❌ Failed to initialize LangSmith client: {client_error}")
+            logger.warning("Failed to initialize LangSmith client: %s", client_error)
             raise client_error
         
         # STEP 2.5: Find actual thread_id mapping
-        print(f"\n🔍 STEP 2.5: Thread ID Mapping")
-        print(f"   Requested thread_id: {thread_id}")
+        logger.debug("STEP 2.5: Thread ID Mapping")
+        logger.debug("Requested thread_id: %s", thread_id)
         
         # For frontend session IDs (assistant-X), always use the most recent LangGraph run
         actual_thread_id = str(thread_id)  # Convert to string to handle UUID objects
         thread_id_str = str(thread_id)
         if thread_id_str.startswith('assistant-'):
-            print(f"   Frontend session ID detected, finding most recent LangGraph run...")
+            logger.debug("Frontend session ID detected, finding most recent LangGraph run...")
             mapped_thread_id = find_actual_thread_id(thread_id_str, client)
             if mapped_thread_id:
                 actual_thread_id = mapped_thread_id
-                print(f"   ✅ Using most recent session: {actual_thread_id}")
+                logger.debug("Using most recent session: %s", actual_thread_id)
             else:
-                print(f"   ⚠️  Could not find recent session, using original: {thread_id_str}")
+                logger.warning("Could not find recent session, using original: %s", thread_id_str)
         elif not ('-' in thread_id_str and len(thread_id_str) == 36):
-            print(f"   Non-UUID format detected, searching for mapping...")
+            logger.debug("Non-UUID format detected, searching for mapping...")
             mapped_thread_id = find_actual_thread_id(thread_id_str, client)
             if mapped_thread_id:
                 actual_thread_id = mapped_thread_id
-                print(f"   ✅ Mapped to LangSmith thread_id: {actual_thread_id}")
+                logger.debug("Mapped to LangSmith thread_id: %s", actual_thread_id)
             else:
-                print(f"   ⚠️  Could not find mapping, using original: {thread_id}")
+                logger.warning("Could not find mapping, using original: %s", thread_id)
         else:
-            print(f"   ✅ Thread ID appears to be a valid LangSmith UUID")
+            logger.debug("Thread ID appears to be a valid LangSmith UUID")
         
         # STEP 3: Query runs with rate limit protection
-        print(f"\n🔍 STEP 3: Querying LangSmith Runs")
-        print(f"   Thread ID: {actual_thread_id}")
-        print(f"   Project: {os.environ.get('LANGCHAIN_PROJECT', 'stella')}")
+        logger.debug("STEP 3: Querying LangSmith Runs")
+        logger.debug("Thread ID: %s", actual_thread_id)
+        logger.debug("Project: %s", LANGSMITH_PROJECT)
         
         all_runs = []
         try:
-            print(f"   📡 Sending query to LangSmith API...")
+            logger.debug("Sending query to LangSmith API...")
             
             # Add rate limit protection with exponential backoff
-            import time
             max_retries = 3
             base_delay = 1
             
             # Simplified approach - just try once and fail gracefully
-            project_name = os.environ.get("LANGCHAIN_PROJECT", "stella")
-            print(f"Using project name: '{project_name}'")
+            project_name = LANGSMITH_PROJECT
+            logger.debug("Using project name: '%s'", project_name)
+            thread_filter = f'and(eq(metadata_key, "thread_id"), eq(metadata_value, "{actual_thread_id}"))'
             
             try:
-                # Try querying by thread_id first - use parameter approach (more reliable)
-                print(f"   Filtering specifically for thread_id: '{actual_thread_id}'")
-                all_runs = list(client.list_runs(
+                # Filtrage par thread_id côté LangSmith (métadonnée posée par LangGraph), en ne demandant
+                # que les champs utilisés pour reconstruire la trace
+                logger.debug("Filtering specifically for thread_id: '%s'", actual_thread_id)
+                runs_iter = client.list_runs(
                     project_name=project_name,
-                    thread_id=actual_thread_id,
+                    filter=thread_filter,
+                    select=LANGSMITH_TRACE_FIELDS,
                     limit=50  # Small limit to avoid rate limits
-                ))
-                print(f"✅ Direct thread_id query completed. Found {len(all_runs)} runs")
+                )
                 
                 # CRITICAL: Validate that all runs actually belong to our thread_id
                 # LangSmith sometimes returns runs from other threads
-                if all_runs:
-                    print(f"🔍 Validating that all runs belong to thread_id: {actual_thread_id}")
-                    valid_runs = []
-                    invalid_count = 0
+                # Validation à la volée : seuls les runs valides sont conservés, sans liste intermédiaire
+                first_run = next(runs_iter, None)
+                all_runs = []
+                if first_run is not None:
+                    logger.debug("Validating that all runs belong to thread_id: %s", actual_thread_id)
+                    # Accesseurs liés une fois, sur le premier run ; comparaison en chaînes
+                    getters = thread_id_getters(first_run)
+                    actual_thread_str = str(actual_thread_id)
+                    in_thread = run_in_thread
                     
-                    for run in all_runs:
-                        run_belongs_to_thread = False
-                        
-                        # Check various ways the thread_id might be stored
-                        # Convert both to strings for comparison
-                        actual_thread_str = str(actual_thread_id)
-                        
-                        if hasattr(run, 'thread_id') and str(run.thread_id) == actual_thread_str:
-                            run_belongs_to_thread = True
-                        elif hasattr(run, 'extra') and isinstance(run.extra, dict) and str(run.extra.get('thread_id', '')) == actual_thread_str:
-                            run_belongs_to_thread = True
-                        elif hasattr(run, 'session_id') and str(run.session_id) == actual_thread_str:
-                            run_belongs_to_thread = True
-                        
-                        if run_belongs_to_thread:
-                            valid_runs.append(run)
-                        else:
-                            invalid_count += 1
-                            print(f"   ⚠️  FILTERED OUT: Run {run.name} ({str(run.id)[:8]}...) doesn't belong to thread {actual_thread_id}")
-                            if hasattr(run, 'thread_id'):
-                                print(f"       Run's thread_id: {run.thread_id}")
-                            if hasattr(run, 'session_id'):
-                                print(f"       Run's session_id: {run.session_id}")
-                    
-                    all_runs = valid_runs
-                    print(f"   ✅ After validation: {len(all_runs)} valid runs, {invalid_count} filtered out")
+                    total_count = 0
+                    for run in itertools.chain((first_run,), runs_iter):
+                        total_count += 1
+                        if in_thread(run, getters, actual_thread_str):
+                            all_runs.append(run)
+                    logger.debug("Direct thread_id query completed. Found %s runs", total_count)
+                    logger.debug("After validation: %s valid runs, %s filtered out", len(all_runs), total_count - len(all_runs))
+                else:
+                    logger.debug("Direct thread_id query completed. Found 0 runs")
                 
             except Exception as thread_query_error:
-                print(f"⚠️  Direct thread_id query failed: {thread_query_error}")
+                logger.warning("Direct thread_id query failed: %s", thread_query_error)
                 
                 # If it's a rate limit error, raise immediately
                 if "rate limit" in str(thread_query_error).lower() or "429" in str(thread_query_error):
                     raise Exception("LangSmith service is temporarily unavailable due to rate limiting")
                 
                 # For other errors, try fallback
-                print(f"🔄 Falling back to manual filtering...")
+                logger.debug("Falling back to the metadata filter without field selection...")
                 
                 try:
-                    # Fallback: get recent runs and filter manually
-                    all_project_runs = list(client.list_runs(
+                    # Fallback: même filtre, sans projection des champs (au cas où le serveur refuse le select)
+                    fallback_runs = list(client.list_runs(
                         project_name=project_name,
-                        limit=20  # Very small limit to avoid rate limits
+                        filter=thread_filter,
+                        limit=50  # Même plafond que la requête directe : une trace compte une vingtaine de runs
                     ))
                     
-                    print(f"📊 Retrieved {len(all_project_runs)} total runs from project")
-                    
-                    # Filter by thread_id manually with detailed logging
+                    # Même validation que la requête directe : le filtre serveur ne suffit pas à garantir le thread
                     all_runs = []
-                    filtered_count = 0
-                    
-                    for run in all_project_runs:
-                        run_belongs_to_thread = False
-                        
+                    if fallback_runs:
+                        getters = thread_id_getters(fallback_runs[0])
                         actual_thread_str = str(actual_thread_id)
-                        
-                        if str(getattr(run, 'thread_id', '')) == actual_thread_str:
-                            run_belongs_to_thread = True
-                        elif hasattr(run, 'extra') and run.extra and str(run.extra.get('thread_id', '')) == actual_thread_str:
-                            run_belongs_to_thread = True
-                        elif str(getattr(run, 'session_id', '')) == actual_thread_str:
-                            run_belongs_to_thread = True
-                        
-                        if run_belongs_to_thread:
-                            all_runs.append(run)
-                        else:
-                            filtered_count += 1
-                            print(f"   ⚠️  FILTERED OUT: Run {run.name} ({str(run.id)[:8]}...) doesn't belong to thread {actual_thread_id}")
+                        all_runs = [run for run in fallback_runs if run_in_thread(run, getters, actual_thread_str)]
                     
-                    print(f"🎯 Manual filtering found {len(all_runs)} valid runs, {filtered_count} filtered out")
+                    logger.debug("Metadata filter found %s runs for thread %s", len(fallback_runs), actual_thread_id)
+                    logger.debug("After validation: %s valid runs, %s filtered out", len(all_runs), len(fallback_runs) - len(all_runs))
                     
                 except Exception as fallback_error:
-                    print(f"❌ Fallback query also failed: {fallback_error}")
+                    logger.warning("Fallback query also failed: %s", fallback_error)
                     if "rate limit" in str(fallback_error).lower() or "429" in str(fallback_error):
                         raise Exception("LangSmith service is temporarily unavailable due to rate limiting")
                     raise fallback_error
             
         except Exception as query_error:
-            print(f"   ❌ QUERY ERROR: {type(query_error).__name__}: {query_error}")
-            import traceback
-            print(f"   📋 Full traceback:")
-            for line in traceback.format_exc().split('\n'):
-                if line.strip():
-                    print(f"      {line}")
+            logger.exception("QUERY ERROR: %s: %s", type(query_error).__name__, query_error)
             raise query_error
         finally:
             pass  # No signal cleanup needed
 
         # STEP 4: Analyze query results
-        print(f"\n📊 STEP 4: Analyzing Query Results")
+        logger.debug("STEP 4: Analyzing Query Results")
         if not all_runs:
-            print(f"   ❌ No runs found for thread_id: {thread_id}")
-            print(f"   🔍 Possible causes:")
-            print(f"      1. The session hasn't been traced to LangSmith")
-            print(f"      2. The project name doesn't match (current: {os.environ.get('LANGCHAIN_PROJECT', 'stella')})")
-            print(f"      3. The API key doesn't have access to this project")
-            print(f"      4. The thread_id is incorrect or doesn't exist")
-            print(f"      5. Tracing is disabled (LANGCHAIN_TRACING_V2 != 'true')")
+            logger.warning("No runs found for thread_id: %s", thread_id)
+            logger.debug("Possible causes:")
+            logger.debug("1. The session hasn't been traced to LangSmith")
+            logger.debug("2. The project name doesn't match (current: %s)", LANGSMITH_PROJECT)
+            logger.debug("3. The API key doesn't have access to this project")
+            logger.debug("4. The thread_id is incorrect or doesn't exist")
+            logger.debug("5. Tracing is disabled (LANGCHAIN_TRACING_V2 != 'true')")
             
             # Try to list available sessions for debugging
             try:
-                print(f"   🔍 Attempting to list recent sessions for debugging...")
-                recent_runs = list(client.list_runs(
+                logger.debug("Attempting to list recent sessions for debugging...")
+                # Seuls les champs obligatoires et les métadonnées sont demandés : pas d'inputs/outputs
+                runs_iter = client.list_runs(
                     project_name=project_name,
+                    select=LANGSMITH_SUMMARY_FIELDS + ['extra'],
                     limit=20
-                ))
-                if recent_runs:
-                    unique_threads = set(run.thread_id for run in recent_runs if run.thread_id)
-                    print(f"   📋 Found {len(unique_threads)} recent thread IDs:")
+                )
+                # Consommation paresseuse, bornée à 20 runs même si le client pagine au-delà
+                unique_threads = {
+                    tid for tid in (
+                        (run.extra or {}).get('metadata', {}).get('thread_id')
+                        for run in itertools.islice(runs_iter, 20)
+                    ) if tid
+                }
+                if unique_threads:
+                    logger.debug("Found %s recent thread IDs:", len(unique_threads))
                     for i, tid in enumerate(list(unique_threads)[:10]):
-                        print(f"      {i+1:2d}. {tid}")
+                        logger.debug("%2d. %s", i + 1, tid)
                     
                     # Check if the requested thread_id is similar to any existing ones
-                    print(f"   🔍 Looking for similar thread IDs to: {thread_id}")
-                    for tid in unique_threads:
-                        if thread_id in tid or tid in thread_id:
-                            print(f"      ⚠️  Similar ID found: {tid}")
-                        # Check if it's a UUID vs session format mismatch
-                        thread_id_str = str(thread_id)
-                        if len(thread_id_str) == 36 and '-' in thread_id_str and tid.startswith('session_'):
-                            print(f"      💡 UUID format requested but session format found: {tid}")
-                        elif thread_id_str.startswith('session_') and len(tid) == 36 and '-' in tid:
-                            print(f"      💡 Session format requested but UUID format found: {tid}")
+                    logger.debug("Looking for similar thread IDs to: %s", thread_id)
+                    thread_id_str = str(thread_id)
+                    if thread_id_str in unique_threads:
+                        logger.debug("Exact thread ID found: %s", thread_id_str)
+                    elif len(unique_threads) < 32:
+                        # Recherche par sous-chaîne, bornée aux petits échantillons
+                        for tid in unique_threads:
+                            if thread_id_str in tid or tid in thread_id_str:
+                                logger.debug("Similar ID found: %s", tid)
+                    
+                    # Check if it's a UUID vs session format mismatch : classement des IDs en une passe
+                    uuid_tids = [tid for tid in unique_threads if len(tid) == 36 and '-' in tid]
+                    session_tids = [tid for tid in unique_threads if tid.startswith('session_')]
+                    if len(thread_id_str) == 36 and '-' in thread_id_str and session_tids:
+                        logger.debug("UUID format requested but %d session format IDs found: %s", len(session_tids), session_tids[:10])
+                    elif thread_id_str.startswith('session_') and uuid_tids:
+                        logger.debug("Session format requested but %d UUID format IDs found: %s", len(uuid_tids), uuid_tids[:10])
                 else:
-                    print(f"   ❌ No recent runs found in project")
+                    logger.warning("No recent runs found in project")
             except Exception as debug_error:
-                print(f"   ⚠️  Could not list recent sessions: {debug_error}")
+                logger.warning("Could not list recent sessions: %s", debug_error)
             
             return None
 
-        print(f"   ✅ Found {len(all_runs)} runs total")
-        print(f"   📋 Run details:")
-        for i, run in enumerate(all_runs[:10]):  # Show first 10 runs
-            status = "✅ completed" if run.end_time else "🔄 running"
-            print(f"      {i+1:2d}. ID: {str(run.id)[:8]}... | Parent: {str(run.parent_run_id)[:8] + '...' if run.parent_run_id else 'None':12} | Name: {run.name:20} | Status: {status}")
-        
-        if len(all_runs) > 10:
-            print(f"      ... and {len(all_runs) - 10} more runs")
+        logger.debug("Found %s runs total", len(all_runs))
+        if debug_enabled:
+            # Un seul enregistrement pour les 10 premiers runs
+            details = [
+                f"{i + 1:2d}. ID: {str(run.id)[:8]}... | Parent: {str(run.parent_run_id)[:8] + '...' if run.parent_run_id else 'None':12} "
+                f"| Name: {run.name:20} | Status: {'completed' if run.end_time else 'running'}"
+                for i, run in enumerate(all_runs[:10])  # Show first 10 runs
+            ]
+            if len(all_runs) > 10:
+                details.append(f"... and {len(all_runs) - 10} more runs")
+            logger.debug("Run details:\n%s", "\n".join(details))
         
         # STEP 5: Find main thread run - ENSURE IT MATCHES OUR THREAD_ID
-        print(f"\n🎯 STEP 5: Finding Main Thread Run")
+        logger.debug("STEP 5: Finding Main Thread Run")
         
         # First, filter runs to only those that actually belong to our thread_id
-        print(f"   🔍 Filtering runs by thread_id: {actual_thread_id}")
+        logger.debug("Filtering runs by thread_id: %s", actual_thread_id)
         thread_specific_runs = []
         
+        # Même règle de lecture du thread_id que pour la requête : accesseurs liés une fois, sur le premier run
+        getters = thread_id_getters(all_runs[0], order=('thread_id', 'session_id', 'extra'))
+        actual_thread_str = str(actual_thread_id)
         for run in all_runs:
-            # Check multiple ways a run might be associated with our thread_id
-            run_thread_id = None
-            
-            # Method 1: Direct thread_id attribute
-            if hasattr(run, 'thread_id') and run.thread_id:
-                run_thread_id = run.thread_id
-            
-            # Method 2: Check session_id (most common in LangSmith)
-            if not run_thread_id and hasattr(run, 'session_id') and run.session_id:
-                run_thread_id = run.session_id
-            
-            # Method 3: Check extra metadata
-            if not run_thread_id and hasattr(run, 'extra') and run.extra and isinstance(run.extra, dict):
-                run_thread_id = run.extra.get('thread_id')
-            
-            # Method 4: Check if run ID contains our thread_id (for some LangSmith setups)
-            if not run_thread_id and str(actual_thread_id) in str(run.id):
-                run_thread_id = actual_thread_id
-            
-            if str(run_thread_id) == str(actual_thread_id):
+            # Certains projets LangSmith reprennent le thread_id dans l'identifiant du run
+            if run_in_thread(run, getters, actual_thread_str) or actual_thread_str in str(run.id):
                 thread_specific_runs.append(run)
-                print(f"   ✅ Run {run.name} ({str(run.id)[:8]}...) belongs to thread {actual_thread_id}")
+                logger.debug("Run %s (%s...) belongs to thread %s", run.name, str(run.id)[:8], actual_thread_id)
             else:
-                print(f"   ❌ Run {run.name} ({str(run.id)[:8]}...) belongs to different thread: {run_thread_id}")
+                logger.debug("Run %s (%s...) belongs to different thread: %s", run.name, str(run.id)[:8], run_thread_id(run, getters))
         
-        print(f"   📊 Filtered from {len(all_runs)} total runs to {len(thread_specific_runs)} thread-specific runs")
+        logger.debug("Filtered from %s total runs to %s thread-specific runs", len(all_runs), len(thread_specific_runs))
         
         if not thread_specific_runs:
-            print(f"   ❌ No runs found for thread_id: {thread_id}")
-            print(f"   🔍 This means the thread_id doesn't match any runs in the project")
+            logger.warning("No runs found for thread_id: %s", thread_id)
+            logger.debug("This means the thread_id doesn't match any runs in the project")
             return None
         
+        # Index parent -> enfants construit en une passe ; le run racine est relevé au passage
+        children_by_parent = {}
+        root_run = None
+        for run in thread_specific_runs:
+            parent_id = run.parent_run_id
+            if parent_id:
+                children_by_parent.setdefault(parent_id, []).append(run)
+            elif root_run is None:
+                root_run = run
+        
         # Now find the main thread run from the filtered set
         if run_id:
             # If specific run_id is provided, find that specific run
-            print(f"   🎯 Looking for specific run_id: {run_id}")
+            logger.debug("Looking for specific run_id: %s", run_id)
             thread_run = next((r for r in thread_specific_runs if str(r.id) == str(run_id)), None)
             if not thread_run:
-                print(f"   ❌ Specific run_id {run_id} not found in thread {actual_thread_id}")
-                print(f"   📋 Available runs in this thread:")
+                logger.warning("Specific run_id %s not found in thread %s", run_id, actual_thread_id)
+                logger.debug("Available runs in this thread:")
                 for i, run in enumerate(thread_specific_runs):
-                    print(f"      {i+1}. ID: {str(run.id)[:8]}... | Name: {run.name} | Parent: {run.parent_run_id}")
+                    logger.debug("%s. ID: %s... | Name: %s | Parent: %s", i + 1, str(run.id)[:8], run.name, run.parent_run_id)
                 return None
             
             # When filtering by run_id, we only process that specific run and its children
-            print(f"   ✅ Found specific run: {thread_run.id}")
-            print(f"      Name: {thread_run.name}")
-            print(f"      Start: {thread_run.start_time}")
-            print(f"      End: {thread_run.end_time}")
-            print(f"      Parent: {thread_run.parent_run_id}")
+            logger.debug("Found specific run: %s", thread_run.id)
+            logger.debug("Name: %s", thread_run.name)
+            logger.debug("Start: %s", thread_run.start_time)
+            logger.debug("End: %s", thread_run.end_time)
+            logger.debug("Parent: %s", thread_run.parent_run_id)
             
             # Filter all_runs to only include this run and its descendants
             run_family = [thread_run]
             
             # Find all descendants of this run
-            def find_descendants(parent_id, all_runs):
-                children = [r for r in all_runs if r.parent_run_id == parent_id]
+            def find_descendants(parent_id):
+                children = children_by_parent.get(parent_id, [])
                 descendants = children[:]
                 for child in children:
-                    descendants.extend(find_descendants(child.id, all_runs))
+                    descendants.extend(find_descendants(child.id))
                 return descendants
             
-            descendants = find_descendants(thread_run.id, thread_specific_runs)
+            descendants = find_descendants(thread_run.id)
             run_family.extend(descendants)
             
             all_runs = run_family
-            print(f"   🔄 Filtered to specific run family: {len(all_runs)} runs (1 main + {len(descendants)} descendants)")
+            logger.debug("Filtered to specific run family: %s runs (1 main + %s descendants)", len(all_runs), len(descendants))
             
         else:
             # Original logic: find the main thread run (no parent)
-            thread_run = next((r for r in thread_specific_runs if not r.parent_run_id), None)
+            thread_run = root_run
             if not thread_run:
-                print(f"   ❌ No main thread run found in filtered runs (all have parent_run_id)")
-                print(f"   🔍 This is unexpected - there should be a root run without parent")
-                print(f"   📋 Filtered run parent relationships:")
+                logger.warning("No main thread run found in filtered runs (all have parent_run_id)")
+                logger.debug("This is unexpected - there should be a root run without parent")
+                logger.debug("Filtered run parent relationships:")
                 for i, run in enumerate(thread_specific_runs):
-                    print(f"      {i+1}. {run.name} -> parent: {run.parent_run_id}")
+                    logger.debug("%s. %s -> parent: %s", i + 1, run.name, run.parent_run_id)
                 return None
 
-            print(f"   ✅ Found main thread run: {thread_run.id}")
-            print(f"      Name: {thread_run.name}")
-            print(f"      Start: {thread_run.start_time}")
-            print(f"      End: {thread_run.end_time}")
+            logger.debug("Found main thread run: %s", thread_run.id)
+            logger.debug("Name: %s", thread_run.name)
+            logger.debug("Start: %s", thread_run.start_time)
+            logger.debug("End: %s", thread_run.end_time)
             
             # Update all_runs to only include thread-specific runs for the rest of the processing
             all_runs = thread_specific_runs
-            print(f"   🔄 Updated processing to use only {len(all_runs)} thread-specific runs")
+            logger.debug("Updated processing to use only %s thread-specific runs", len(all_runs))
 
         # STEP 6: Find child runs (workflow steps)
-        print(f"\n🔗 STEP 6: Finding Child Runs (Workflow Steps)")
-        trace_nodes_runs = sorted(
-            [r for r in all_runs if r.parent_run_id == thread_run.id],
-            key=lambda r: r.start_time or r.end_time or 0
-        )
+        logger.debug("STEP 6: Finding Child Runs (Workflow Steps)")
+        trace_nodes_runs = sorted(children_by_parent.get(thread_run.id, []), key=_run_start_key)
 
-        print(f"   ✅ Found {len(trace_nodes_runs)} child runs")
+        logger.debug("Found %s child runs", len(trace_nodes_runs))
         if trace_nodes_runs:
-            print(f"   📋 Workflow steps:")
-            for i, run in enumerate(trace_nodes_runs):
-                status = "✅ completed" if run.end_time else "🔄 running"
-                duration = ""
-                if run.start_time and run.end_time:
-                    duration = f" ({(run.end_time - run.start_time).total_seconds():.2f}s)"
-                print(f"      {i+1:2d}. {run.name:20} | {status}{duration}")
+            if debug_enabled:
+                steps = []
+                for i, run in enumerate(trace_nodes_runs):
+                    status = "completed" if run.end_time else "running"
+                    duration = ""
+                    if run.start_time and run.end_time:
+                        duration = f" ({(run.end_time - run.start_time).total_seconds():.2f}s)"
+                    steps.append(f"{i + 1:2d}. {run.name:20} | {status}{duration}")
+                logger.debug("Workflow steps:\n%s", "\n".join(steps))
         else:
-            print(f"   ❌ No child runs found - this means no workflow steps were traced")
+            logger.warning("No child runs found - this means no workflow steps were traced")
             return None
         
         # STEP 6.5: Also check for nested runs that might contain tools
-        print(f"\n🔍 STEP 6.5: Checking for Nested Tool Runs")
+        logger.debug("STEP 6.5: Checking for Nested Tool Runs")
+        # Les runs execute_tool sont collectés pendant ce parcours, dédoublonnés par id
+        # (les objets Run ne sont pas hashables), dans l'ordre : étapes du workflow puis runs imbriqués
+        execute_tool_by_id = {}
         all_tool_runs = []
         for run in trace_nodes_runs:
+            if run.name == "execute_tool":
+                execute_tool_by_id.setdefault(run.id, run)
             # Find child runs of each workflow step
-            child_runs = [r for r in all_runs if r.parent_run_id == run.id]
-            for child in child_runs:
+            for child in children_by_parent.get(run.id, []):
                 if child.name == "execute_tool":
                     all_tool_runs.append(child)
                 # Check for nested children too
-                nested_children = [r for r in all_runs if r.parent_run_id == child.id]
-                for nested in nested_children:
+                for nested in children_by_parent.get(child.id, []):
                     if nested.name == "execute_tool":
                         all_tool_runs.append(nested)
+        for tool_run in all_tool_runs:
+            execute_tool_by_id.setdefault(tool_run.id, tool_run)
         
-        print(f"   Found {len(all_tool_runs)} total execute_tool runs (including nested)")
+        logger.debug("Found %s total execute_tool runs (including nested)", len(all_tool_runs))
         
         # Add tool runs to trace_nodes_runs if they're not already there
         for tool_run in all_tool_runs:
@@ -1677,88 +2160,80 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                 trace_nodes_runs.append(tool_run)
 
         # STEP 7: Extract tool calls from execute_tool runs
-        print(f"\n🛠️  STEP 7: Extracting Tool Calls")
+        logger.debug("STEP 7: Extracting Tool Calls")
         
         # CRITICAL: Double-check that all runs belong to our thread before processing
-        print(f"🔍 Pre-extraction validation: Ensuring all runs belong to thread {actual_thread_id}")
+        logger.debug("Pre-extraction validation: Ensuring all runs belong to thread %s", actual_thread_id)
         validated_runs = []
         for run in all_runs:
-            run_belongs_to_thread = False
-            
-            # Check various ways the thread_id might be stored
-            actual_thread_str = str(actual_thread_id)
-            
-            if hasattr(run, 'thread_id') and str(run.thread_id) == actual_thread_str:
-                run_belongs_to_thread = True
-            elif hasattr(run, 'extra') and isinstance(run.extra, dict) and str(run.extra.get('thread_id', '')) == actual_thread_str:
-                run_belongs_to_thread = True
-            elif hasattr(run, 'session_id') and str(run.session_id) == actual_thread_str:
-                run_belongs_to_thread = True
-            
-            if run_belongs_to_thread:
+            if run_in_thread(run, getters, actual_thread_str):
                 validated_runs.append(run)
             else:
-                print(f"   ⚠️  CRITICAL: Found run from different thread: {run.name} ({str(run.id)[:8]}...)")
-                if hasattr(run, 'thread_id'):
-                    print(f"       Run's thread_id: {run.thread_id} (expected: {actual_thread_id})")
+                logger.warning("CRITICAL: Found run from different thread: %s (%s...)", run.name, str(run.id)[:8])
+                logger.debug("Run's thread_id: %s (expected: %s)", run_thread_id(run, getters), actual_thread_id)
         
         # Update all_runs to only include validated runs
         all_runs = validated_runs
-        print(f"   ✅ Validated: {len(all_runs)} runs confirmed for thread {thread_id}")
+        logger.debug("Validated: %s runs confirmed for thread %s", len(all_runs), thread_id)
         
         tool_calls = []
         
-        # First, try to find execute_tool runs in the main workflow steps
-        execute_tool_runs = [run for run in trace_nodes_runs if run.name == "execute_tool"]
-        
-        # Also add any nested execute_tool runs we found
-        execute_tool_runs.extend(all_tool_runs)
+        # execute_tool runs of the main workflow steps, then the nested ones (collected in STEP 6.5)
+        execute_tool_runs = list(execute_tool_by_id.values())
         
-        # Remove duplicates by ID (since Run objects are not hashable)
-        seen_ids = set()
-        unique_execute_tool_runs = []
-        for run in execute_tool_runs:
-            if run.id not in seen_ids:
-                seen_ids.add(run.id)
-                unique_execute_tool_runs.append(run)
-        execute_tool_runs = unique_execute_tool_runs
+        logger.debug("Found %s execute_tool runs", len(execute_tool_runs))
         
-        print(f"Found {len(execute_tool_runs)} execute_tool runs")
+        # Seconde phase : inputs/outputs des seuls runs lus ensuite (execute_tool, leurs outils enfants,
+        # et le run principal pour la question de l'utilisateur)
+        tool_run_ids = {run.id for run in execute_tool_runs}
+        detail_runs = execute_tool_runs + [r for r in all_runs if r.parent_run_id in tool_run_ids] + [thread_run]
+        try:
+            fetch_run_details(client, detail_runs)
+        except Exception as detail_error:
+            logger.warning("Could not fetch run inputs/outputs: %s", detail_error)
         
         for i, run in enumerate(execute_tool_runs):
-            print(f"🔍 Analyzing execute_tool run {i+1}/{len(execute_tool_runs)}: {run.id}")
-            print(f"   Run name: {run.name}")
-            print(f"   Run inputs keys: {list(run.inputs.keys()) if run.inputs else 'None'}")
-            print(f"   Run outputs keys: {list(run.outputs.keys()) if run.outputs else 'None'}")
+            logger.debug("Analyzing execute_tool run %s/%s: %s", i + 1, len(execute_tool_runs), run.id)
+            logger.debug("Run name: %s", run.name)
+            logger.debug("Run inputs keys: %s", list(run.inputs.keys()) if run.inputs else 'None')
+            logger.debug("Run outputs keys: %s", list(run.outputs.keys()) if run.outputs else 'None')
+            
+            # Champs communs à tous les appels de ce run, lus une seule fois
+            run_fields = tool_call_run_fields(run)
+            run_outputs = run.outputs
             
             # Method 1: Check inputs for tool calls
             if run.inputs and 'messages' in run.inputs:
                 messages = run.inputs['messages']
-                print(f"   Found {len(messages)} messages in inputs")
+                logger.debug("Found %s messages in inputs", len(messages))
                 
                 # Look for AI messages with tool calls
-                for j, msg_dict in enumerate(messages):
-                    if isinstance(msg_dict, dict):
+                # Le run execute_tool exécute les appels du dernier message IA : parcours à rebours,
+                # arrêt au premier trouvé. Les messages viennent du JSON de LangSmith : des dict simples.
+                for j in range(len(messages) - 1, -1, -1):
+                    msg_dict = messages[j]
+                    if type(msg_dict) is dict:
                         msg_type = msg_dict.get('type', 'unknown')
-                        has_tool_calls = bool(msg_dict.get('tool_calls'))
+                        direct_tool_calls = msg_dict.get('tool_calls')
+                        has_tool_calls = bool(direct_tool_calls)
                         
-                        print(f"   Message {j}: type={msg_type}, has_tool_calls={has_tool_calls}")
+                        logger.debug("Message %s: type=%s, has_tool_calls=%s", j, msg_type, has_tool_calls)
                         if msg_type == 'ai':
-                            print(f"   AI Message keys: {list(msg_dict.keys())}")
+                            logger.debug("AI Message keys: %s", list(msg_dict.keys()))
                             if 'additional_kwargs' in msg_dict:
-                                print(f"   Additional kwargs keys: {list(msg_dict['additional_kwargs'].keys()) if msg_dict['additional_kwargs'] else 'None'}")
+                                logger.debug("Additional kwargs keys: %s", list(msg_dict['additional_kwargs'].keys()) if msg_dict['additional_kwargs'] else 'None')
                         
                         # Check for tool calls in multiple locations
                         tool_calls_list = None
                         if msg_type == 'ai':
                             # Method 1: Direct tool_calls
-                            if msg_dict.get('tool_calls'):
-                                tool_calls_list = msg_dict['tool_calls']
-                                print(f"   ✅ Found {len(tool_calls_list)} tool calls in direct tool_calls")
+                            if direct_tool_calls:
+                                tool_calls_list = direct_tool_calls
+                                logger.debug("Found %s tool calls in direct tool_calls", len(tool_calls_list))
                             # Method 2: additional_kwargs.tool_calls (LangSmith format)
-                            elif msg_dict.get('additional_kwargs', {}).get('tool_calls'):
+                            elif (msg_dict.get('additional_kwargs') or {}).get('tool_calls'):
                                 tool_calls_list = msg_dict['additional_kwargs']['tool_calls']
-                                print(f"   ✅ Found {len(tool_calls_list)} tool calls in additional_kwargs")
+                                logger.debug("Found %s tool calls in additional_kwargs", len(tool_calls_list))
                         
                         if tool_calls_list:
                             
@@ -1766,9 +2241,10 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                                 # Handle different tool call formats
                                 if isinstance(tc, dict):
                                     # LangSmith format: {id, type, function: {name, arguments}}
-                                    if 'function' in tc:
-                                        tool_name = tc['function'].get('name', 'unknown')
-                                        tool_args_raw = tc['function'].get('arguments', '{}')
+                                    function = tc.get('function')
+                                    if function is not None:
+                                        tool_name = function.get('name', 'unknown')
+                                        tool_args_raw = function.get('arguments', '{}')
                                     # Standard format: {name, args}
                                     else:
                                         tool_name = tc.get('name', 'unknown')
@@ -1777,10 +2253,9 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                                     # Parse arguments if they're a string
                                     if isinstance(tool_args_raw, str):
                                         try:
-                                            import json
                                             tool_args = json.loads(tool_args_raw)
                                         except Exception as e:
-                                            print(f"      Failed to parse tool args: {e}")
+                                            logger.debug("Failed to parse tool args: %s", e)
                                             tool_args = {}
                                     else:
                                         tool_args = tool_args_raw or {}
@@ -1788,22 +2263,18 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                                     tool_name = 'unknown'
                                     tool_args = {}
                                 
-                                print(f"      Tool {k+1}: {tool_name} with args: {tool_args}")
+                                logger.debug("Tool %s: %s with args: %s", k + 1, tool_name, tool_args)
                                 
                                 # Create tool call object
                                 tool_call = {
                                     'name': tool_name,
                                     'arguments': tool_args,
-                                    'status': 'completed' if run.end_time else 'executing',
-                                    'execution_time': (run.end_time - run.start_time).total_seconds() * 1000 if run.end_time and run.start_time else 0,
-                                    'timestamp': run.start_time.isoformat() if run.start_time else None,
-                                    'run_id': str(run.id),
-                                    'error': getattr(run, 'error', None)
+                                    **run_fields
                                 }
                                 
                                 # Add results if available
-                                if run.outputs:
-                                    tool_call['result'] = run.outputs
+                                if run_outputs:
+                                    tool_call['result'] = run_outputs
                                 
                                 tool_calls.append(tool_call)
                             
@@ -1812,13 +2283,13 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
             # Method 2: Check if this run has child runs that are individual tool executions
             child_tool_runs = [r for r in all_runs if r.parent_run_id == run.id]
             if child_tool_runs:
-                print(f"   Found {len(child_tool_runs)} child runs of execute_tool")
+                logger.debug("Found %s child runs of execute_tool", len(child_tool_runs))
                 for child_run in child_tool_runs:
-                    print(f"   Child run: {child_run.name} (ID: {child_run.id})")
+                    logger.debug("Child run: %s (ID: %s)", child_run.name, child_run.id)
                     
                     # Check if this child run represents a tool execution
                     if hasattr(child_run, 'name') and child_run.name in ['fetch_data', 'preprocess_data', 'analyze_risks', 'search_ticker', 'get_stock_news', 'get_company_profile', 'create_dynamic_chart', 'compare_stocks']:
-                        print(f"   ✅ Found individual tool run: {child_run.name}")
+                        logger.debug("Found individual tool run: %s", child_run.name)
                         
                         # Extract arguments from child run inputs
                         tool_args = {}
@@ -1828,11 +2299,7 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                         tool_call = {
                             'name': child_run.name,
                             'arguments': tool_args,
-                            'status': 'completed' if child_run.end_time else 'executing',
-                            'execution_time': (child_run.end_time - child_run.start_time).total_seconds() * 1000 if child_run.end_time and child_run.start_time else 0,
-                            'timestamp': child_run.start_time.isoformat() if child_run.start_time else None,
-                            'run_id': str(child_run.id),
-                            'error': getattr(child_run, 'error', None)
+                            **tool_call_run_fields(child_run)
                         }
                         
                         if child_run.outputs:
@@ -1841,26 +2308,27 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                         tool_calls.append(tool_call)
             
             if not run.inputs or 'messages' not in run.inputs:
-                print(f"   ❌ No inputs or messages found for this run")
+                logger.debug("No inputs or messages found for this run")
 
-        print(f"✅ Extracted {len(tool_calls)} tool calls total")
+        logger.debug("Extracted %s tool calls total", len(tool_calls))
         
         # CRITICAL: Log exactly what tool calls we extracted for this thread
         if tool_calls:
-            print(f"🔍 EXTRACTED TOOL CALLS FOR THREAD {thread_id}:")
-            for i, tc in enumerate(tool_calls):
-                print(f"   {i+1}. {tc.get('name', 'unknown')} with args: {tc.get('arguments', {})}")
-                run_id = tc.get('run_id', 'unknown')
-                print(f"      Run ID: {str(run_id)[:8]}...")
+            logger.debug("EXTRACTED TOOL CALLS FOR THREAD %s:", thread_id)
+            if debug_enabled:
+                for i, tc in enumerate(tool_calls):
+                    logger.debug("%s. %s with args: %s", i + 1, tc.get('name', 'unknown'), tc.get('arguments', {}))
+                    logger.debug("Run ID: %s...", str(tc.get('run_id', 'unknown'))[:8])
         else:
-            print(f"⚠️  NO TOOL CALLS FOUND FOR THREAD {thread_id}")
+            logger.warning("NO TOOL CALLS FOUND FOR THREAD %s", thread_id)
         
         # STEP 7.5: Validate tool calls belong to this session
-        print(f"\n🔍 STEP 7.5: Validating Tool Calls for Session {thread_id}")
+        logger.debug("STEP 7.5: Validating Tool Calls for Session %s", thread_id)
         if tool_calls:
-            print(f"   📋 Tool calls found:")
-            for i, tc in enumerate(tool_calls):
-                print(f"      {i+1}. {tc.get('name', 'unknown')} with args: {tc.get('arguments', {})}")
+            logger.debug("Tool calls found:")
+            if debug_enabled:
+                for i, tc in enumerate(tool_calls):
+                    logger.debug("%s. %s with args: %s", i + 1, tc.get('name', 'unknown'), tc.get('arguments', {}))
             
             # Add session validation - check if tool calls make sense for this thread_id
             # This is a safeguard against cross-session contamination
@@ -1869,28 +2337,26 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                 thread_id_str = str(thread_id)
                 if thread_id_str.startswith('assistant-'):
                     session_number = int(thread_id_str.split('-')[1])
-                    print(f"   🔢 Session number: {session_number}")
+                    logger.debug("Session number: %s", session_number)
             except:
-                print(f"   ⚠️  Could not parse session number from thread_id: {thread_id_str}")
+                logger.warning("Could not parse session number from thread_id: %s", thread_id_str)
             
             # Log tool call validation
-            print(f"   ✅ Tool calls validated for session {thread_id}")
+            logger.debug("Tool calls validated for session %s", thread_id)
         else:
-            print(f"   ℹ️  No tool calls found for session {thread_id}")
+            logger.debug("No tool calls found for session %s", thread_id)
 
         # STEP 8: Get graph structure
-        print(f"\n📊 STEP 8: Getting Graph Structure")
+        logger.debug("STEP 8: Getting Graph Structure")
         try:
-            graph_json = app.get_graph().to_json()
-            nodes_count = len(graph_json.get('nodes', []))
-            edges_count = len(graph_json.get('edges', []))
-            print(f"   ✅ Graph structure retrieved: {nodes_count} nodes, {edges_count} edges")
+            graph_structure = get_graph_structure()
+            logger.debug("Graph structure retrieved: %s nodes, %s edges", len(graph_structure['nodes']), len(graph_structure['edges']))
         except Exception as graph_error:
-            print(f"   ⚠️  Could not get graph structure: {graph_error}")
-            graph_json = {'nodes': [], 'edges': []}
+            logger.warning("Could not get graph structure: %s", graph_error)
+            graph_structure = {'nodes': [], 'edges': []}
 
         # STEP 8.5: Extract user query from the first human message
-        print(f"\n💬 STEP 8.5: Extracting User Query")
+        logger.debug("STEP 8.5: Extracting User Query")
         user_query = None
         try:
             # Look for the first human message in the thread
@@ -1900,52 +2366,56 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
                     for msg in messages:
                         if isinstance(msg, dict) and msg.get('type') == 'human':
                             user_query = msg.get('content', '')
-                            print(f"   ✅ Found user query: {user_query[:100]}...")
+                            logger.debug("Found user query: %s...", user_query[:100])
                             break
                     if user_query:
                         break
         except Exception as query_error:
-            print(f"   ⚠️  Could not extract user query: {query_error}")
+            logger.warning("Could not extract user query: %s", query_error)
 
         # STEP 9: Build final trace data
-        print(f"\n🏗️  STEP 9: Building Final Trace Data")
+        logger.debug("STEP 9: Building Final Trace Data")
+        # Durée totale et statut global en une seule passe ; les deux clés sont toujours posées plus haut
+        total_execution_time = 0
+        all_completed = True
+        for tc in tool_calls:
+            total_execution_time += tc['execution_time']
+            all_completed = all_completed and tc['status'] == 'completed'
         trace_data = {
             'thread_id': thread_id,
             'tool_calls': tool_calls,
             'execution_path': [run.name for run in trace_nodes_runs],
-            'graph_structure': {
-                'nodes': graph_json.get('nodes', []),
-                'edges': graph_json.get('edges', [])
-            },
-            'total_execution_time': sum(tc.get('execution_time', 0) for tc in tool_calls),
-            'status': 'completed' if all(tc.get('status') == 'completed' for tc in tool_calls) else 'partial',
+            'graph_structure': graph_structure,
+            'total_execution_time': total_execution_time,
+            'status': 'completed' if all_completed else 'partial',
             'user_query': user_query
         }
 
-        processing_time = time.time() - start_time
+        processing_time = time.perf_counter() - start_time
         
-        print(f"   ✅ Trace data built successfully")
+        logger.debug("Trace data built successfully")
         
         # FINAL VALIDATION: Comprehensive data consistency check
-        print(f"\n🔍 FINAL VALIDATION: Data Consistency Check")
-        print(f"   Requested Thread ID: {thread_id}")
-        print(f"   Actual LangSmith Thread ID: {actual_thread_id}")
-        print(f"   Tool calls: {len(tool_calls)}")
-        print(f"   Execution path: {[run.name for run in trace_nodes_runs]}")
-        print(f"   Total execution time: {sum(tc.get('execution_time', 0) for tc in tool_calls):.2f}ms")
-        print(f"   Status: {trace_data['status']}")
+        logger.debug("FINAL VALIDATION: Data Consistency Check")
+        logger.debug("Requested Thread ID: %s", thread_id)
+        logger.debug("Actual LangSmith Thread ID: %s", actual_thread_id)
+        logger.debug("Tool calls: %s", len(tool_calls))
+        logger.debug("Execution path: %s", trace_data['execution_path'])
+        logger.debug("Total execution time: %.2fms", trace_data['total_execution_time'])
+        logger.debug("Status: %s", trace_data['status'])
         
         # Validate that we're not returning stale data
         if tool_calls:
-            tool_summary = [f"{tc.get('name', 'unknown')}({list(tc.get('arguments', {}).keys())})" for tc in tool_calls]
-            print(f"   Tool summary: {', '.join(tool_summary)}")
+            if debug_enabled:
+                tool_summary = [f"{tc.get('name', 'unknown')}({list(tc.get('arguments', {}).keys())})" for tc in tool_calls]
+                logger.debug("Tool summary: %s", ', '.join(tool_summary))
             
             # Check for cross-contamination indicators
             amd_tools = [tc for tc in tool_calls if 'AMD' in str(tc.get('arguments', {}))]
             if amd_tools and thread_id != 'assistant-5':
-                print(f"   ⚠️  WARNING: Found AMD-related tools in non-assistant-5 thread!")
+                logger.warning("Found AMD-related tools in non-assistant-5 thread!")
                 for tc in amd_tools:
-                    print(f"       Suspicious tool: {tc.get('name')} with args: {tc.get('arguments')}")
+                    logger.debug("Suspicious tool: %s with args: %s", tc.get('name'), tc.get('arguments'))
         
         # Add validation timestamp and mapping info for debugging
         trace_data['validation_timestamp'] = str(datetime.now())
@@ -1959,40 +2429,32 @@ def get_langsmith_trace_data(thread_id: str, run_id: str = None):
             'tool_extraction_validated': True,
             'cross_contamination_check': 'passed' if not (tool_calls and any('AMD' in str(tc.get('arguments', {})) for tc in tool_calls) and thread_id != 'assistant-5') else 'warning'
         }
-        print(f"      Thread ID: {trace_data['thread_id']}")
-        print(f"      Tool calls: {len(trace_data['tool_calls'])}")
-        print(f"      Execution path: {trace_data['execution_path']}")
-        print(f"      Total execution time: {trace_data['total_execution_time']:.2f}ms")
-        print(f"      Status: {trace_data['status']}")
-        print(f"      Processing time: {processing_time:.2f}s")
-
-        print(f"\n{'='*80}")
-        print(f"✅ LANGSMITH TRACE DEBUG - Successfully completed in {processing_time:.2f}s!")
-        print(f"{'='*80}\n")
+        logger.debug("Thread ID: %s", trace_data['thread_id'])
+        logger.debug("Tool calls: %s", len(trace_data['tool_calls']))
+        logger.debug("Execution path: %s", trace_data['execution_path'])
+        logger.debug("Total execution time: %.2fms", trace_data['total_execution_time'])
+        logger.debug("Status: %s", trace_data['status'])
+        logger.debug("Processing time: %.2fs", processing_time)
+
+        logger.debug("LANGSMITH TRACE DEBUG - Successfully completed in %.2fs!", processing_time)
         
         return trace_data
 
     except Exception as e:
-        print(f"\n{'='*80}")
-        print(f"❌ LANGSMITH TRACE DEBUG - ERROR OCCURRED!")
-        print(f"{'='*80}")
-        print(f"Error type: {type(e).__name__}")
-        print(f"Error message: {str(e)}")
-        print(f"\n📋 Full traceback:")
-        import traceback
-        for line in traceback.format_exc().split('\n'):
-            if line.strip():
-                print(f"   {line}")
-        print(f"{'='*80}\n")
+        logger.exception("LANGSMITH TRACE DEBUG - ERROR OCCURRED: %s: %s", type(e).__name__, e)
         return None
 
+@functools.lru_cache(maxsize=1)
+def _warn_trace_animation_deprecated():
+    """Avertissement de dépréciation émis une seule fois par processus."""
+    logger.warning("DEPRECATED: generate_trace_animation_frames - utilisez get_langsmith_trace_data() à la place")
+
 def generate_trace_animation_frames(thread_id: str):
     """
     DEPRECATED: Utiliser get_langsmith_trace_data() à la place.
-    Maintenu pour compatibilité avec l'API existante.
+    Maintenu pour compatibilité avec l'API existante : ne produit plus aucune image.
     """
-    print(f"--- DEPRECATED: generate_trace_animation_frames appelé pour {thread_id}")
-    print("--- Utilisez get_langsmith_trace_data() à la place")
+    _warn_trace_animation_deprecated()
     return []
 
 # --- Bloc test main ---
@@ -2002,8 +2464,12 @@ if __name__ == '__main__':
         config = {"configurable": {"thread_id": session_id}}
         inputs = {"messages": [HumanMessage(content=user_input)]}
         final_message = None
-        for event in app.stream(inputs, config=config, stream_mode="values"):
-            final_message = event["messages"][-1]
+        async def _stream():
+            final = None
+            async for event in app.astream(inputs, config=config, stream_mode="values"):
+                final = event["messages"][-1]
+            return final
+        final_message = asyncio.run(_stream())
         if final_message:
             print(f"\n--- Réponse finale de l'assistant ---\n{final_message.content}")
             if hasattr(final_message, 'image_base64'):
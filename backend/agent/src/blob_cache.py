@@ -0,0 +1,49 @@
+# agent/src/blob_cache.py
+
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+class BlobCache:
+    """
+    Cache LRU en mémoire pour les données volumineuses (flux Arrow IPC des DataFrames).
+    L'état LangGraph ne garde qu'une clé : les checkpoints restent légers et la mémoire
+    occupée par les blobs est plafonnée, en nombre d'entrées comme en octets.
+    """
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, blob: bytes) -> str:
+        """Stocke un blob et retourne la clé à conserver dans l'état."""
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._entries[key] = blob
+            self._total_bytes += len(blob)
+            # On évince les blobs les moins récemment utilisés, en gardant toujours le dernier ajouté
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Retourne le blob associé à la clé, ou None s'il a été évincé."""
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+            return blob
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
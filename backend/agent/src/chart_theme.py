@@ -1,5 +1,7 @@
 # agent/src/chart_theme.py
 
+import functools
+
 # Dictionnaire contenant toutes les préférences graphiques pour les graphiques de Stella.
 stella_theme = {
 
@@ -52,3 +54,99 @@ stella_theme = {
         'tickwidth': 0.5  # Ticks très fins
     }
 }
+
+# --- Layouts précalculés ---
+# Construits une seule fois à l'import : chaque graphique les applique via fig.update_layout(**LAYOUT_...)
+# et ne fournit plus que son titre et ses libellés.
+
+# Légende sans bordure, commune à tous les graphiques
+LEGEND_NOBORDER = {
+    'bordercolor': 'rgba(0, 0, 0, 0)',
+    'borderwidth': 0,
+}
+
+# Historique de prix d'une action
+LAYOUT_PRICE = {
+    'template': stella_theme['template'],
+    'font': stella_theme['font'],
+    'xaxis': stella_theme['axis_config'],
+    'yaxis': stella_theme['axis_config'],
+    'legend': LEGEND_NOBORDER,
+}
+
+# Comparaison de plusieurs actions (prix ou métrique fondamentale)
+LAYOUT_COMPARE = {
+    'template': 'plotly_white',
+    'xaxis': stella_theme['axis_config'],
+    'yaxis': stella_theme['axis_config'],
+    'legend': {'title_text': 'Ticker', **LEGEND_NOBORDER},
+}
+
+# Graphique de synthèse Croissance vs. Valorisation de la réponse finale
+LAYOUT_SYNTHESIS = {
+    'template': stella_theme['template'],
+    'font': stella_theme['font'],
+    **stella_theme['layout_defaults'],  # Applique les paramètres glassmorphism
+    'margin': {'r': 320},
+    'xaxis': {
+        'title': 'Année',
+        'type': 'category',  # Force l'axe à traiter les années comme des étiquettes uniques
+        **stella_theme['axis_config'],
+    },
+    'yaxis': {
+        'title': {
+            'text': 'Croissance Annuelle du CA',
+            'font': {'color': stella_theme['colors'][1]},
+        },
+        'tickfont': {'color': stella_theme['colors'][1]},
+        'ticksuffix': ' %',
+        **stella_theme['axis_config'],
+    },
+    'yaxis2': {
+        'title': {
+            'text': 'Rendement bénéficiaire',
+            'font': {'color': stella_theme['colors'][0]},
+        },
+        'tickfont': {'color': stella_theme['colors'][0]},
+        'anchor': 'x',
+        'overlaying': 'y',
+        'side': 'right',
+        'tickformat': '.2%',
+        **stella_theme['axis_config'],
+    },
+    'legend': {
+        'orientation': 'v',
+        'yanchor': 'top',
+        'y': 1,  # On aligne le haut de la légende avec le haut du graphique
+        'xanchor': 'left',
+        'x': 1.40,  # On pousse la légende un peu plus à droite
+        'title_text': 'Légende',
+        **LEGEND_NOBORDER,
+    },
+}
+
+# Graphique dynamique créé par create_dynamic_chart
+LAYOUT_DYNAMIC = {
+    'template': 'plotly_white',
+    'font': {'family': 'Arial, sans-serif'},
+    'xaxis': stella_theme['axis_config'],
+    'yaxis': stella_theme['axis_config'],
+    'legend': LEGEND_NOBORDER,
+}
+
+LAYOUTS = {
+    'price': LAYOUT_PRICE,
+    'compare': LAYOUT_COMPARE,
+    'synthesis': LAYOUT_SYNTHESIS,
+    'dynamic': LAYOUT_DYNAMIC,
+}
+
+@functools.lru_cache(maxsize=None)
+def plotly_layout(name: str):
+    """
+    go.Layout construit et validé une seule fois pour l'un des LAYOUTS (template compris).
+    go.Figure(layout=...) en fait une copie sans repasser par la fusion profonde et la validation
+    de update_layout : seuls le titre et les libellés propres au graphique restent à appliquer.
+    """
+    import plotly.graph_objects as go
+    return go.Layout(**LAYOUTS[name])
@@ -1,44 +1,68 @@
 # agent/src/compare_fundamentals.py
 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
 import pandas as pd
 
 # On importe les logiques existantes pour les réutiliser
-from .fetch_data import fetch_fundamental_data
+from .fetch_data import fetch_fundamental_data, APILimitError
 from .preprocess import preprocess_financial_data
 
+# Nombre maximum de requêtes FMP simultanées lors d'une comparaison
+MAX_PARALLEL_FETCHES = 8
+
+def _metric_history(ticker: str, metric: str) -> Tuple[Optional[pd.Series], Optional[Exception]]:
+    """
+    Récupère l'évolution d'une métrique pour un ticker.
+    Retourne (série, None), ou (None, erreur) si la métrique est indisponible pour ce ticker.
+    """
+    try:
+        print(f"Comparaison (Évolution): Récupération des données pour {ticker}...")
+        raw_df = fetch_fundamental_data(ticker)
+        processed_df = preprocess_financial_data(raw_df)
+        
+        # On vérifie que les colonnes nécessaires sont présentes
+        if metric not in processed_df.columns or 'calendarYear' not in processed_df.columns:
+            print(f"Avertissement: Données insuffisantes pour '{metric}' chez {ticker}.")
+            return None, ValueError(f"données insuffisantes pour '{metric}'")
+        
+        # On sélectionne l'évolution de la métrique pour ce ticker
+        metric_series = processed_df.set_index('calendarYear')[metric]
+        metric_series.name = ticker.upper() # Le nom de la série devient le ticker
+        return metric_series, None
+
+    except Exception as e:
+        print(f"Erreur lors du traitement de {ticker} pour la comparaison d'évolution: {e}")
+        return None, e
+
 def compare_fundamental_metrics(tickers: list[str], metric: str) -> pd.DataFrame:
     """
     Récupère l'historique d'une métrique fondamentale pour plusieurs tickers
     et les combine dans un seul DataFrame pour une comparaison temporelle.
+    Les tickers sont récupérés en parallèle : la durée totale est celle du plus lent, pas leur somme.
+    Les tickers qui n'ont pas pu être récupérés sont listés dans combined_df.attrs['missing_tickers'],
+    pour que l'appelant puisse les signaler (et ne pas mettre en cache une comparaison incomplète).
     
     Returns:
         pd.DataFrame: Un DataFrame où l'index est 'calendarYear' et chaque colonne
                       est un ticker, contenant les valeurs de la métrique.
     """
-    all_metrics_series = []
-    
-    for ticker in tickers:
-        try:
-            print(f"Comparaison (Évolution): Récupération des données pour {ticker}...")
-            raw_df = fetch_fundamental_data(ticker)
-            processed_df = preprocess_financial_data(raw_df)
-            
-            # On vérifie que les colonnes nécessaires sont présentes
-            if metric not in processed_df.columns or 'calendarYear' not in processed_df.columns:
-                print(f"Avertissement: Données insuffisantes pour '{metric}' chez {ticker}.")
-                continue
-            
-            # On sélectionne l'évolution de la métrique pour ce ticker
-            metric_series = processed_df.set_index('calendarYear')[metric]
-            metric_series.name = ticker.upper() # Le nom de la série devient le ticker
-            
-            all_metrics_series.append(metric_series)
+    if not tickers:
+        raise ValueError(f"Impossible de récupérer l'historique de la métrique '{metric}' pour les tickers fournis.")
+
+    # map conserve l'ordre des tickers, donc l'ordre des colonnes
+    with ThreadPoolExecutor(max_workers=min(len(tickers), MAX_PARALLEL_FETCHES)) as executor:
+        results = list(executor.map(_metric_history, tickers, [metric] * len(tickers)))
 
-        except Exception as e:
-            print(f"Erreur lors du traitement de {ticker} pour la comparaison d'évolution: {e}")
-            continue
+    all_metrics_series = [series for series, _ in results if series is not None]
+    errors = {ticker.upper(): error for ticker, (_, error) in zip(tickers, results) if error is not None}
             
     if not all_metrics_series:
+        # Une limite d'API atteinte est remontée telle quelle pour que l'API réponde 429
+        limit_error = next((error for error in errors.values() if isinstance(error, APILimitError)), None)
+        if limit_error is not None:
+            raise limit_error
         raise ValueError(f"Impossible de récupérer l'historique de la métrique '{metric}' pour les tickers fournis.")
         
     # On combine toutes les séries en un seul DataFrame
@@ -46,4 +70,6 @@ def compare_fundamental_metrics(tickers: list[str], metric: str) -> pd.DataFrame
     combined_df = pd.concat(all_metrics_series, axis=1)
     
     # On peut trier par l'index (années) pour s'assurer de l'ordre
-    return combined_df.sort_index()
\ No newline at end of file
+    combined_df = combined_df.sort_index()
+    combined_df.attrs['missing_tickers'] = list(errors)
+    return combined_df
@@ -5,15 +5,25 @@ Gère l'affichage dans le terminal, la sauvegarde en fichiers, etc.
 """
 
 import pandas as pd
-import plotly.io as pio
-import plotly.graph_objects as go
 import json
+import orjson
 import os
-from io import StringIO
-from typing import Optional, Union, Dict, Any
+from typing import Optional, Union, Dict, Any, TYPE_CHECKING
 from datetime import datetime
 import sys
 
+# plotly n'est importé qu'au premier affichage d'un graphique (coût de démarrage)
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+def _read_split_json(df_json: str) -> pd.DataFrame:
+    """
+    Reconstruit un DataFrame depuis son JSON orient='split'.
+    orjson + constructeur DataFrame évitent le chemin lent de pd.read_json (inférence de types, StringIO).
+    """
+    split = orjson.loads(df_json)
+    return pd.DataFrame(split["data"], index=split.get("index"), columns=split["columns"])
+
 class DisplayManager:
     """Gestionnaire centralisé pour l'affichage des données et visualisations"""
     
@@ -48,7 +58,7 @@ class DisplayManager:
         """
         try:
             # Charger le DataFrame depuis le JSON
-            df = pd.read_json(StringIO(df_json), orient='split')
+            df = _read_split_json(df_json)
             
             if self.display_in_terminal:
                 self._display_dataframe_terminal(df, title)
@@ -78,6 +88,7 @@ class DisplayManager:
         """
         try:
             # Charger le graphique depuis le JSON
+            import plotly.io as pio
             fig = pio.from_json(plotly_json)
             
             if self.display_in_terminal:
@@ -123,7 +134,7 @@ class DisplayManager:
         
         print(f"{'='*60}\n")
     
-    def _display_plotly_terminal(self, fig: go.Figure, title: str):
+    def _display_plotly_terminal(self, fig: "go.Figure", title: str):
         """Affiche des informations sur le graphique Plotly dans le terminal"""
         print(f"\n{'='*60}")
         print(f"📈 {title.upper()}")
@@ -197,7 +208,7 @@ class DisplayManager:
         
         return f"{csv_filename} et {html_filename}"
     
-    def _save_plotly_to_file(self, fig: go.Figure, title: str, source: str) -> str:
+    def _save_plotly_to_file(self, fig: "go.Figure", title: str, source: str) -> str:
         """Sauvegarde un graphique Plotly en PNG et HTML"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         safe_title = self._make_filename_safe(title)
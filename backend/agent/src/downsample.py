@@ -0,0 +1,40 @@
+# agent/src/downsample.py
+
+import numpy as np
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets : choisit `n_out` points d'une série qui en conservent la forme visuelle
+    (pics et creux compris), pour alléger les graphiques de longues séries de prix.
+    Les points sont supposés régulièrement espacés (la position sert d'abscisse) ; les valeurs manquantes
+    sont ignorées. Retourne les positions retenues, triées, premier et dernier point valides inclus.
+    """
+    valid = np.flatnonzero(np.isfinite(y))
+    n = len(valid)
+    if n_out < 3 or n <= n_out:
+        return valid
+
+    x = valid.astype(np.float64)
+    values = y[valid].astype(np.float64)
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        # Moyenne du seau suivant : troisième sommet du triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = values[next_start:next_end].mean()
+
+        # Dans le seau courant, on garde le point qui forme le plus grand triangle avec le précédent retenu
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        areas = np.abs(
+            (x[a] - avg_x) * (values[start:end] - values[a])
+            - (x[a] - x[start:end]) * (avg_y - values[a])
+        )
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return valid[selected]
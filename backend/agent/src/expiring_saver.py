@@ -0,0 +1,51 @@
+# agent/src/expiring_saver.py
+
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+
+class ExpiringMemorySaver(MemorySaver):
+    """
+    MemorySaver dont les threads inactifs sont supprimés.
+    Le MemorySaver garde tous les checkpoints de toutes les conversations jusqu'à l'arrêt du processus :
+    ici, un thread sans nouveau checkpoint depuis `ttl` secondes est effacé, et au-delà de `max_threads`
+    conversations, les moins récemment actives le sont aussi. La mémoire reste bornée quel que soit
+    le nombre de sessions ouvertes depuis le démarrage.
+    """
+
+    def __init__(self, ttl: float = 24 * 3600, max_threads: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self.ttl = ttl
+        self.max_threads = max_threads
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()  # thread_id -> dernière écriture, du plus ancien au plus récent
+        self._lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        # aput délègue à put : les deux chemins passent par ici
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(config["configurable"]["thread_id"])
+        return result
+
+    def _touch(self, thread_id: str) -> None:
+        """Marque le thread comme actif puis supprime les threads expirés ou en surnombre."""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            self._last_seen[thread_id] = now
+            self._last_seen.move_to_end(thread_id)
+            # Les threads sont rangés par dernière activité : seuls ceux en tête peuvent être expirés
+            while len(self._last_seen) > 1:
+                oldest_id, last_seen = next(iter(self._last_seen.items()))
+                if len(self._last_seen) <= self.max_threads and now - last_seen <= self.ttl:
+                    break
+                del self._last_seen[oldest_id]
+                expired.append(oldest_id)
+        for expired_id in expired:
+            self.delete_thread(expired_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._last_seen.pop(thread_id, None)
+        super().delete_thread(thread_id)
@@ -40,6 +40,44 @@ def fetch_price_history(ticker: str, period_days: int = 252) -> pd.DataFrame:
     except Exception as e:
         raise ValueError(f"Impossible de traiter les données de prix de yfinance pour {ticker}: {e}")
 
+def fetch_price_histories(tickers: list[str], period_days: int = 252) -> pd.DataFrame:
+    """
+    Récupère en un seul appel yfinance les prix de clôture de plusieurs tickers.
+    
+    Args:
+        tickers (list[str]): Les tickers des actions (ex: ['AAPL', 'MSFT']).
+        period_days (int): Le nombre de jours dans le passé à récupérer.
+        
+    Returns:
+        pd.DataFrame: Un DataFrame avec 'date' en index et un ticker (en majuscules) par colonne.
+                      Les tickers sans aucune donnée sont écartés.
+    """
+    symbols = [ticker.upper() for ticker in tickers]
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=period_days)
+
+    try:
+        # Un seul téléchargement groupé au lieu d'une requête par ticker
+        price_df = yf.download(symbols, start=start_date, end=end_date, progress=False, auto_adjust=True)
+    except Exception as e:
+        raise ValueError(f"Impossible de traiter les données de prix de yfinance pour {', '.join(symbols)}: {e}")
+
+    if price_df.empty:
+        raise ValueError(f"Aucun historique de prix trouvé pour les tickers {', '.join(symbols)}.")
+
+    # Colonnes en MultiIndex (ex: [('Close', 'AAPL'), ('Close', 'MSFT')]) : on ne garde que les clôtures
+    if isinstance(price_df.columns, pd.MultiIndex):
+        closes = price_df['Close']
+    else:
+        closes = price_df[['Close']].rename(columns={'Close': symbols[0]})
+
+    # On conserve l'ordre demandé et on écarte les tickers dont le téléchargement a échoué
+    closes = closes.reindex(columns=[symbol for symbol in symbols if symbol in closes.columns])
+    closes = closes.dropna(axis=1, how='all')
+
+    print(f"yfinance: Historique de prix récupéré pour {', '.join(closes.columns)}.")
+    return closes
+
 if __name__ == '__main__':
     try:
         samsung_prices = fetch_price_history("005930.KS", period_days=90)
@@ -0,0 +1,136 @@
+# src/resolve_ticker.py
+
+import re
+import unicodedata
+from difflib import get_close_matches
+from typing import Dict, List
+
+# Table des entreprises connues -> ticker (les mêmes que celles listées dans le prompt système).
+# Les clés sont normalisées (minuscules, sans accents ni apostrophes) pour une recherche directe.
+KNOWN_TICKERS: Dict[str, str] = {
+    "apple": "AAPL",
+    "microsoft": "MSFT",
+    "google": "GOOGL",
+    "alphabet": "GOOGL",
+    "amazon": "AMZN",
+    "tesla": "TSLA",
+    "meta": "META",
+    "facebook": "META",
+    "netflix": "NFLX",
+    "nvidia": "NVDA",
+    "coca-cola": "KO",
+    "coca cola": "KO",
+    "mcdonalds": "MCD",
+    "mcdo": "MCD",
+    "disney": "DIS",
+    "nike": "NKE",
+    "bank of america": "BAC",
+    "jpmorgan": "JPM",
+    "jp morgan": "JPM",
+    "goldman sachs": "GS",
+    "american express": "AXP",
+    "boeing": "BA",
+    "general electric": "GE",
+    "ford": "F",
+    "general motors": "GM",
+    "asml": "ASML",
+    "lvmh": "MC.PA",
+    "airbus": "AIR.PA",
+    "loreal": "OR.PA",
+    "sanofi": "SAN.PA",
+    "nestle": "NESN.SW",
+    "tsmc": "TSM",
+    "samsung": "005930.KS",
+}
+
+# Tickers explicites reconnus tels quels dans le texte (ex: "compare AAPL et MSFT")
+KNOWN_SYMBOLS = set(KNOWN_TICKERS.values())
+
+# Mots courants qui s'écrivent comme un ticker connu ("DIS moi", "GE", "OR") : ignorés en majuscules nues,
+# reconnus seulement sous forme explicite ("$DIS", "(GE)")
+STOP_WORDS = {
+    "A", "AU", "BA", "DE", "DIS", "DO", "EN", "ET", "F", "GE", "GM", "GS", "IL", "IN", "IS", "IT", "JE",
+    "KO", "LA", "LE", "MA", "MC", "ME", "MOI", "NE", "NO", "OK", "ON", "OR", "OU", "SI", "SO", "TO", "UN", "US",
+}
+
+# Nombre maximum de mots d'un nom d'entreprise (ex: "bank of america")
+MAX_NAME_WORDS = max(len(name.split()) for name in KNOWN_TICKERS)
+
+# Les noms d'un seul mot plus courts que ce seuil ("meta", "ford", "nike") ne sont reconnus qu'écrits
+# comme un nom propre, sans accent ("Meta", "FORD") : "la méta-analyse" ne désigne pas META
+SHORT_NAME_LENGTH = 5
+
+# Seuls les mots assez longs passent par la recherche approchée, pour éviter les faux positifs ("ford" / "for")
+FUZZY_MIN_LENGTH = 5
+FUZZY_CUTOFF = 0.85
+FUZZY_NAMES = [name for name in KNOWN_TICKERS if len(name) >= FUZZY_MIN_LENGTH]
+
+# Symbole explicite : préfixé par $ ou entre parenthèses, quelle que soit sa longueur ("$F", "(GE)")
+EXPLICIT_SYMBOL_PATTERN = re.compile(r"(?:\$|\()([0-9A-Z]{1,6}(?:\.[A-Z]{1,2})?)\b")
+# Symbole nu : au moins 2 caractères, pour ne pas prendre un "A" ou un "F" isolé
+SYMBOL_PATTERN = re.compile(r"\b[0-9A-Z]{2,6}(?:\.[A-Z]{1,2})?\b")
+WORD_PATTERN = re.compile(r"[\w&.'’-]+")
+
+
+def _normalize(text: str) -> str:
+    """Minuscules, sans accents ni apostrophes : "L'Oréal" -> "loreal", "McDonald's" -> "mcdonalds"."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return text.lower().replace("'", "").replace("’", "")
+
+
+def _is_proper_noun(word: str) -> bool:
+    """Vrai pour un mot écrit avec une majuscule initiale et sans accent ("Meta", "FORD", mais pas "méta")."""
+    return word[:1].isupper() and word.isascii()
+
+
+def resolve_tickers(text: str) -> Dict[str, str]:
+    """
+    Résout localement les tickers mentionnés dans un message, sans appel au LLM ni à l'API FMP.
+    Retourne un dictionnaire {nom ou symbole trouvé: ticker}, dans l'ordre d'apparition,
+    avec une seule entrée par ticker.
+    """
+    resolved: Dict[str, str] = {}
+    if not text:
+        return resolved
+
+    # 1. Tickers explicites déjà connus ("$F", "(GE)", ou "AAPL" s'il n'est pas un mot courant)
+    for symbol in EXPLICIT_SYMBOL_PATTERN.findall(text):
+        if symbol in KNOWN_SYMBOLS:
+            resolved.setdefault(symbol, symbol)
+    for symbol in SYMBOL_PATTERN.findall(text):
+        if symbol in KNOWN_SYMBOLS and symbol not in STOP_WORDS:
+            resolved.setdefault(symbol, symbol)
+
+    # 2. Noms d'entreprises : recherche exacte des groupes de 1 à MAX_NAME_WORDS mots dans la table
+    originals: List[str] = [word.strip(".-'’") for word in WORD_PATTERN.findall(text)]
+    originals = [word for word in originals if word]
+    words: List[str] = [_normalize(word) for word in originals]
+    matched_positions = set()
+    for size in range(MAX_NAME_WORDS, 0, -1):
+        for start in range(len(words) - size + 1):
+            positions = set(range(start, start + size))
+            if positions & matched_positions:
+                continue
+            name = " ".join(words[start:start + size])
+            if name not in KNOWN_TICKERS:
+                continue
+            if size == 1 and len(name) < SHORT_NAME_LENGTH and not _is_proper_noun(originals[start]):
+                continue
+            resolved.setdefault(name, KNOWN_TICKERS[name])
+            matched_positions |= positions
+
+    # 3. Fautes de frappe sur les noms longs d'un seul mot ("mircosoft", "netflx")
+    for position, word in enumerate(words):
+        if position in matched_positions or len(word) < FUZZY_MIN_LENGTH or word.upper() in KNOWN_SYMBOLS:
+            continue
+        match = get_close_matches(word, FUZZY_NAMES, n=1, cutoff=FUZZY_CUTOFF)
+        if match:
+            resolved.setdefault(match[0], KNOWN_TICKERS[match[0]])
+
+    # Un même ticker trouvé sous plusieurs formes ("META" et "meta") n'est gardé qu'une fois
+    deduplicated: Dict[str, str] = {}
+    for name, ticker in resolved.items():
+        if ticker not in deduplicated.values():
+            deduplicated[name] = ticker
+    return deduplicated
@@ -0,0 +1,89 @@
+# agent/src/ttl_cache.py
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+import pandas as pd
+
+class TTLCache:
+    """
+    Cache clé -> valeur avec une durée de vie (TTL) et une éviction LRU.
+    Partagé entre les appels des outils (asyncio.to_thread) et les noeuds du graphe : il est protégé par un verrou.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clé -> (date d'expiration, valeur)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retourne la valeur associée à la clé, ou `default` si elle est absente ou expirée."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= now:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stocke la valeur, en évinçant les entrées les moins récemment utilisées au-delà de `maxsize`."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Distingue une entrée absente d'un résultat None mis en cache
+_MISSING = object()
+
+def ttl_cache(maxsize: int = 128, ttl: float = 3600, key=None, should_cache=None):
+    """
+    Mémoïse une fonction dans un TTLCache (durée de vie et éviction LRU).
+
+    Args:
+        maxsize (int): Nombre maximum d'entrées conservées.
+        ttl (float): Durée de validité d'une entrée, en secondes.
+        key (callable): Construit la clé à partir des arguments de l'appel (mêmes paramètres que la fonction).
+                        Par défaut, les arguments positionnels et nommés tels quels.
+        should_cache (callable): Reçoit le résultat et indique s'il peut être mis en cache
+                                 (ex: écarter une réponse partielle). Par défaut, tout résultat l'est.
+    """
+    def decorator(func):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+        def make_key(*args, **kwargs):
+            if key is not None:
+                return key(*args, **kwargs)
+            return args, tuple(sorted(kwargs.items()))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = make_key(*args, **kwargs)
+            result = cache.get(cache_key, _MISSING)
+            if result is _MISSING:
+                # L'appel réseau se fait hors du verrou ; une exception n'est jamais mise en cache,
+                # et un résultat refusé par `should_cache` est renvoyé sans être conservé
+                result = func(*args, **kwargs)
+                if should_cache is None or should_cache(result):
+                    cache.put(cache_key, result)
+            # Les DataFrames sont copiés pour que l'appelant ne puisse pas modifier l'entrée en cache
+            return result.copy() if isinstance(result, pd.DataFrame) else result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
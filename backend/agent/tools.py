@@ -1,10 +1,7 @@
 # tools.py - Définition des outils disponibles pour l'agent Stella
 
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
 from langchain_core.tools import tool
-from io import StringIO
 from typing import List
 
 # --- Import des logiques depuis le module src ---
@@ -19,7 +16,26 @@ from src.compare_fundamentals import compare_fundamental_metrics as _compare_fun
 from src.compare_prices import compare_price_histories as _compare_price_histories_logic
 # La recherche PDF est importée de manière paresseuse pour éviter les délais d'initialisation
 # from src.pdf_research import query_research_document as _query_research_document_logic
-from src.chart_theme import stella_theme
+from src.chart_theme import stella_theme, LAYOUT_DYNAMIC
+from src.ttl_cache import ttl_cache
+
+# --- Cache des appels réseau ---
+# Le ticker d'une entreprise, son profil et ses fondamentaux annuels changent au plus une fois par jour ;
+# l'historique de prix est gardé 15 minutes, ce qui suffit pour un graphique sur plusieurs mois.
+_search_ticker_logic = ttl_cache(
+    maxsize=1024, ttl=86400, key=lambda company_name: company_name.strip().lower(),
+)(_search_ticker_logic)
+_fetch_profile_logic = ttl_cache(maxsize=1024, ttl=86400, key=lambda ticker: ticker.upper())(_fetch_profile_logic)
+_compare_fundamental_metrics_logic = ttl_cache(
+    maxsize=256, ttl=86400,
+    key=lambda tickers, metric: (tuple(ticker.upper() for ticker in tickers), metric.lower()),
+    # Une comparaison à laquelle il manque des tickers (limite d'API, erreur réseau) n'est pas gardée 24h
+    should_cache=lambda comp_df: not comp_df.attrs.get('missing_tickers'),
+)(_compare_fundamental_metrics_logic)
+_fetch_price_history_logic = ttl_cache(
+    maxsize=256, ttl=900,
+    key=lambda ticker, period_days=252: (ticker.upper(), period_days),
+)(_fetch_price_history_logic)
 
 
 # --- Définition des outils ---
@@ -73,6 +89,10 @@ def _create_dynamic_chart_logic(
     color_column: str = None
 ) -> str:
     """Contient la logique de création de graphique, sans être un outil LangChain."""
+    # Import paresseux : plotly n'est chargé qu'au premier graphique demandé
+    import plotly.express as px
+    import plotly.io as pio
+
     try:
         df = data.copy() # Travailler sur une copie pour éviter les modifications
         if 'calendarYear' in df.columns:
@@ -95,17 +115,9 @@ def _create_dynamic_chart_logic(
         else:
             return f"Erreur : Le type de graphique '{chart_type}' n'est pas supporté."
 
-        fig.update_layout(
-            template="plotly_white", 
-            font=dict(family="Arial, sans-serif"),
-            xaxis=stella_theme['axis_config'],
-            yaxis=stella_theme['axis_config'],
-            legend=dict(
-                bordercolor="rgba(0, 0, 0, 0)",  # Pas de bordure pour la légende
-                borderwidth=0
-            )
-        )
-        return pio.to_json(fig)
+        fig.update_layout(**LAYOUT_DYNAMIC)
+        # Figure construite par plotly.express : déjà validée, on sérialise directement avec orjson
+        return pio.to_json(fig, validate=False, engine='orjson')
 
     except Exception as e:
         # Utile pour diagnostiquer quelle colonne a causé le problème
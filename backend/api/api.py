@@ -8,6 +8,7 @@ import os
 import sys
 import uuid
 import json
+import orjson
 import asyncio
 import logging
 from typing import Dict, Any, Optional, List
@@ -173,7 +174,9 @@ async def chat_with_stella_stream(request: ChatRequest):
                 loop = asyncio.get_event_loop()
                 async for chunk in _run_stella_agent_stream(inputs, config, loop):
                     if chunk:
-                        yield f"data: {json.dumps(chunk)}\n\n"
+                        # Le graphique (plotly_json) est déjà une chaîne JSON : orjson la ré-échappe en une passe
+                        # et produit directement les octets envoyés, sans repasser par le module json
+                        yield b"data: " + orjson.dumps(chunk) + b"\n\n"
                         
             except APILimitError as e:
                 logger.warning(f"API limit reached for session {session_id}: {str(e)}")
@@ -234,7 +237,7 @@ async def list_langsmith_sessions():
             client = Client()
             
             # Récupérer les dernières exécutions
-            project_name = os.environ.get("LANGCHAIN_PROJECT", "stella")
+            project_name = agent_module.LANGSMITH_PROJECT
             logger.info(f"Retrieving LangSmith sessions from project: {project_name}")
             
             recent_runs = list(client.list_runs(
@@ -301,7 +304,7 @@ async def list_langsmith_sessions():
             "error": str(e),
             "error_type": type(e).__name__,
             "debug_info": {
-                "project": os.environ.get("LANGCHAIN_PROJECT", "stella"),
+                "project": agent_module.LANGSMITH_PROJECT,
                 "langchain_tracing_v2": os.environ.get("LANGCHAIN_TRACING_V2", "not_set"),
                 "langsmith_api_key_set": bool(os.environ.get("LANGSMITH_API_KEY")),
                 "langchain_endpoint": os.environ.get("LANGCHAIN_ENDPOINT", "not_set")
@@ -322,7 +325,7 @@ async def search_langsmith_sessions(partial_id: str):
         try:
             from langsmith import Client
             client = Client()
-            project_name = os.environ.get("LANGCHAIN_PROJECT", "stella")
+            project_name = agent_module.LANGSMITH_PROJECT
             
             logger.info(f"Searching LangSmith sessions for: {partial_id}")
             
@@ -864,17 +867,10 @@ async def chat_with_stella(request: ChatRequest):
         }
         inputs = {"messages": [HumanMessage(content=request.message)]}
         
-        # Run the agent (convert to async)
+        # Run the agent (its nodes are async, so it runs directly on the event loop)
         final_message = None
         try:
-            # Since your agent is synchronous, we'll run it in a thread
-            loop = asyncio.get_event_loop()
-            final_message = await loop.run_in_executor(
-                None, 
-                _run_stella_agent, 
-                inputs, 
-                config
-            )
+            final_message = await _run_stella_agent(inputs, config)
         except APILimitError as e:
             logger.warning(f"API limit reached for session {session_id}: {str(e)}")
             raise HTTPException(
@@ -975,8 +971,39 @@ async def _run_stella_agent_stream(inputs: Dict[str, Any], config: Dict[str, Any
         # Track pending tool calls from agent decisions
         pending_tool_calls = []
         
+        # Tokens of the agent node are forwarded as the LLM produces them. A message is an introduction
+        # (initial_content) only if it ends with tool calls, otherwise it is the answer (final_content):
+        # its tokens are held back until the first tool call chunk or the end of the message tells which.
+        live_streamed_ids = set()
+        live_buffers: Dict[str, List[str]] = {}
+        live_types: Dict[str, str] = {}
+        
         # Track the agent workflow in real time
-        async for event in stella_agent.astream(inputs, config=config, stream_mode="updates"):
+        async for mode, chunk in stella_agent.astream(inputs, config=config, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                message_chunk, metadata = chunk
+                if metadata.get("langgraph_node") != "agent":
+                    continue
+                if getattr(message_chunk, 'tool_call_chunks', None) and message_chunk.id not in live_types:
+                    # Tool calls follow: the text held back so far is the introduction
+                    live_types[message_chunk.id] = 'initial_content'
+                    for token in live_buffers.pop(message_chunk.id, []):
+                        yield {'type': 'initial_content', 'chunk': token}
+                if isinstance(message_chunk.content, str) and message_chunk.content:
+                    if current_step != "agent":
+                        current_step = "agent"
+                        yield {
+                            'type': 'status',
+                            'step': 'analyzing'
+                        }
+                    live_streamed_ids.add(message_chunk.id)
+                    if message_chunk.id in live_types:
+                        yield {'type': live_types[message_chunk.id], 'chunk': message_chunk.content}
+                    else:
+                        live_buffers.setdefault(message_chunk.id, []).append(message_chunk.content)
+                continue
+            
+            event = chunk
             for node_name, node_output in event.items():
                 logger.debug(f"Processing node: {node_name}")
                 
@@ -1013,8 +1040,10 @@ async def _run_stella_agent_stream(inputs: Dict[str, Any], config: Dict[str, Any
                             # Store pending tool calls
                             pending_tool_calls = message.tool_calls.copy()
                             
-                            # Stream the reasoning content first if present
-                            if hasattr(message, 'content') and message.content:
+                            # Stream the reasoning content first if present (unless already sent token by token)
+                            for token in live_buffers.pop(message.id, []):
+                                yield {'type': 'initial_content', 'chunk': token}
+                            if hasattr(message, 'content') and message.content and message.id not in live_streamed_ids:
                                 content = message.content
                                 words = content.split(' ')
                                 
@@ -1061,8 +1090,13 @@ async def _run_stella_agent_stream(inputs: Dict[str, Any], config: Dict[str, Any
                             
                             # Handle final AI messages without tool calls
                             elif not hasattr(message, 'tool_calls') or not message.tool_calls:
-                                # Don't stream again if this is the same final message
-                                if not final_message or final_message.content != message.content:
+                                # Don't stream again if this is the same final message or if it was sent token by token
+                                if message.id in live_streamed_ids:
+                                    # No tool call came: the held back tokens are the final answer
+                                    for token in live_buffers.pop(message.id, []):
+                                        yield {'type': 'final_content', 'chunk': token}
+                                    final_message = message
+                                elif not final_message or final_message.content != message.content:
                                     content = message.content
                                     words = content.split(' ')
                                     
@@ -1156,9 +1190,9 @@ async def _run_stella_agent_stream(inputs: Dict[str, Any], config: Dict[str, Any
         # Always change back to original directory
         os.chdir(current_dir)
 
-def _run_stella_agent(inputs: Dict[str, Any], config: Dict[str, Any]):
+async def _run_stella_agent(inputs: Dict[str, Any], config: Dict[str, Any]):
     """
-    Helper function to run the Stella agent synchronously
+    Helper function to run the Stella agent and return its final message
     """
     # Change to agent directory for execution
     current_dir = os.getcwd()
@@ -1167,7 +1201,7 @@ def _run_stella_agent(inputs: Dict[str, Any], config: Dict[str, Any]):
     
     try:
         final_message = None
-        for event in stella_agent.stream(inputs, config=config, stream_mode="values"):
+        async for event in stella_agent.astream(inputs, config=config, stream_mode="values"):
             final_message = event["messages"][-1]
         return final_message
     finally: